@@ -0,0 +1,32 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.urls import reverse
+
+
+async def aget_user(request):
+    """
+    Resolve ``request.user`` outside the event loop and return it, or None
+    for anonymous users.
+    """
+    return await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+
+
+def async_login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if await aget_user(request) is None:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def async_staff_member_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if user is None or not (user.is_active and user.is_staff):
+            return redirect_to_login(request.get_full_path(), reverse("admin:login"))
+        return await view(request, *args, **kwargs)
+    return wrapper
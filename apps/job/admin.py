@@ -0,0 +1,10 @@
+from django.contrib import admin
+from django.contrib.admin import register
+
+from apps.job.models import Job
+
+
+@register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "task", "status", "progress_done", "progress_total", "user", "created_time", "finished_time")
+    list_filter = ("status", "task")
@@ -0,0 +1,48 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.job.utils import claim_job, requeue_stale_jobs, run_job, schedule
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty.")
+        parser.add_argument("--sleep", type=float, default=2, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--concurrency", type=int, default=1, help="Number of jobs run in parallel.")
+
+    def handle(self, *args, **options):
+        requeue_stale_jobs()
+        threads = [
+            threading.Thread(target=self.work, args=(options, False), daemon=True)
+            for _ in range(options["concurrency"] - 1)
+        ]
+        for thread in threads:
+            thread.start()
+        self.work(options, True)
+        for thread in threads:
+            thread.join()
+
+    def work(self, options, scheduler):
+        try:
+            while True:
+                if scheduler:
+                    requeue_stale_jobs()
+                for task, interval in settings.JOB_SCHEDULE.items():
+                    if scheduler and interval:
+                        schedule(task, interval)
+                job = claim_job()
+                if job is None:
+                    if options["once"]:
+                        return
+                    time.sleep(options["sleep"])
+                    continue
+                job = run_job(job)
+                self.stdout.write(f"{job.task} #{job.id}: {job.status}")
+        finally:
+            connection.close()
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 20:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
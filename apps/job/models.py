@@ -0,0 +1,70 @@
+from django.db import models
+from django.db.models import F
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+class Job(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (QUEUED, "queued"),
+        (RUNNING, "running"),
+        (DONE, "done"),
+        (FAILED, "failed"),
+    )
+
+    task = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, blank=True)
+    user = models.ForeignKey(User, related_name="job_user", on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_time = models.DateTimeField(auto_now_add=True)
+    started_time = models.DateTimeField(null=True, blank=True)
+    finished_time = models.DateTimeField(null=True, blank=True)
+    # Refreshed by the worker running the job, an old one means the worker died.
+    heartbeat_time = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"{self.task} - {self.status}: {self.id}"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def set_progress(self, done, total=None):
+        fields = {"progress_done": done}
+        if total is not None:
+            fields["progress_total"] = total
+        Job.objects.filter(pk=self.pk).update(**fields)
+
+    def publish(self, result):
+        """
+        Store a partial result while the job is still running.
+        """
+        self.result = result
+        Job.objects.filter(pk=self.pk).update(result=result)
+
+    def advance(self, step=1):
+        Job.objects.filter(pk=self.pk).update(progress_done=F("progress_done") + step)
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "task": self.task,
+            "status": self.status,
+            "done": self.progress_done,
+            "total": self.progress_total,
+            "result": self.result,
+            "error": self.error,
+        }
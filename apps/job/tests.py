@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from apps.job import utils
+from apps.job.models import Job
+
+
+def add_task(job):
+    return job.payload["a"] + job.payload["b"]
+
+
+def failing_task(job):
+    raise ValueError("boom")
+
+
+def slow_task(job):
+    import time
+
+    time.sleep(0.3)
+    return True
+
+
+class EnqueueTests(TestCase):
+
+    def test_enqueue(self):
+        user = User.objects.create(username="u")
+        job = utils.enqueue("apps.job.tests.add_task", {"a": 1, "b": 2}, user=user)
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.payload, {"a": 1, "b": 2})
+        self.assertEqual(job.user, user)
+
+    def test_enqueue_once_returns_the_pending_job(self):
+        first = utils.enqueue_once("apps.job.tests.add_task")
+        self.assertEqual(utils.enqueue_once("apps.job.tests.add_task"), first)
+        Job.objects.filter(pk=first.pk).update(status=Job.DONE)
+        self.assertNotEqual(utils.enqueue_once("apps.job.tests.add_task"), first)
+
+    def test_complete(self):
+        job = utils.complete("apps.job.tests.add_task", {"value": 3})
+        self.assertTrue(job.is_finished)
+        self.assertEqual(job.result, {"value": 3})
+
+    def test_schedule_waits_for_the_interval(self):
+        self.assertIsNotNone(utils.schedule("apps.job.tests.add_task", 60))
+        # Still pending.
+        self.assertIsNone(utils.schedule("apps.job.tests.add_task", 60))
+        Job.objects.update(status=Job.DONE, finished_time=timezone.now())
+        self.assertIsNone(utils.schedule("apps.job.tests.add_task", 60))
+        Job.objects.update(finished_time=timezone.now() - timedelta(seconds=61))
+        self.assertIsNotNone(utils.schedule("apps.job.tests.add_task", 60))
+
+
+class ClaimTests(TestCase):
+
+    def test_claims_oldest_due_job_once(self):
+        later = utils.enqueue("apps.job.tests.add_task", run_after=timezone.now() + timedelta(hours=1))
+        first = utils.enqueue("apps.job.tests.add_task")
+        second = utils.enqueue("apps.job.tests.add_task")
+
+        job = utils.claim_job()
+        self.assertEqual(job, first)
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.heartbeat_time)
+        self.assertEqual(utils.claim_job(), second)
+        # The delayed job is not due yet.
+        self.assertIsNone(utils.claim_job())
+        self.assertEqual(Job.objects.get(pk=later.pk).status, Job.QUEUED)
+
+    def test_requeue_only_expired_heartbeats(self):
+        old = timezone.now() - timedelta(seconds=utils.JOB_STALE_AFTER + 1)
+        stale = Job.objects.create(task="t", status=Job.RUNNING, started_time=old, heartbeat_time=old)
+        # Started long ago, but its worker is still alive.
+        alive = Job.objects.create(task="t", status=Job.RUNNING, started_time=old, heartbeat_time=timezone.now())
+        legacy = Job.objects.create(task="t", status=Job.RUNNING, started_time=old)
+
+        self.assertEqual(utils.requeue_stale_jobs(), 2)
+        self.assertEqual(Job.objects.get(pk=stale.pk).status, Job.QUEUED)
+        self.assertEqual(Job.objects.get(pk=alive.pk).status, Job.RUNNING)
+        self.assertEqual(Job.objects.get(pk=legacy.pk).status, Job.QUEUED)
+
+    def test_stale_job_fails_after_max_attempts(self):
+        old = timezone.now() - timedelta(seconds=utils.JOB_STALE_AFTER + 1)
+        retried = Job.objects.create(
+            task="t", status=Job.RUNNING, heartbeat_time=old, attempts=utils.JOB_MAX_ATTEMPTS - 1
+        )
+        exhausted = Job.objects.create(
+            task="t", status=Job.RUNNING, heartbeat_time=old, attempts=utils.JOB_MAX_ATTEMPTS
+        )
+
+        with self.assertLogs("apps.job.utils", "WARNING"):
+            self.assertEqual(utils.requeue_stale_jobs(), 1)
+        self.assertEqual(Job.objects.get(pk=retried.pk).status, Job.QUEUED)
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, Job.FAILED)
+        self.assertIsNotNone(exhausted.finished_time)
+        # Never claimed again.
+        self.assertEqual(utils.claim_job(), retried)
+        self.assertIsNone(utils.claim_job())
+
+
+class RunJobTests(TransactionTestCase):
+
+    def test_run_job_stores_result(self):
+        utils.enqueue("apps.job.tests.add_task", {"a": 1, "b": 2})
+        job = utils.run_job(utils.claim_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result, 3)
+        self.assertIsNotNone(job.finished_time)
+
+    def test_run_job_records_failure(self):
+        utils.enqueue("apps.job.tests.failing_task")
+        job = utils.run_job(utils.claim_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("boom", job.error)
+
+    def test_heartbeat_is_refreshed_while_running(self):
+        utils.enqueue("apps.job.tests.slow_task")
+        job = utils.claim_job()
+        claimed_heartbeat = job.heartbeat_time
+        heartbeat = utils.Heartbeat(job, interval=0.05)
+        heartbeat.start()
+        try:
+            slow_task(job)
+        finally:
+            heartbeat.stop()
+        self.assertGreater(Job.objects.get(pk=job.pk).heartbeat_time, claimed_heartbeat)
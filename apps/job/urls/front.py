@@ -0,0 +1,8 @@
+from django.urls import path
+
+from apps.job.views.front import job_status
+
+
+urlpatterns = [
+    path("<int:id>/", job_status, name="job-status"),
+]
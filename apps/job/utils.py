@@ -0,0 +1,132 @@
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.job.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+JOB_STALE_AFTER = settings.JOB_STALE_AFTER
+JOB_HEARTBEAT_INTERVAL = settings.JOB_HEARTBEAT_INTERVAL
+JOB_MAX_ATTEMPTS = settings.JOB_MAX_ATTEMPTS
+
+
+
+def enqueue(task, payload=None, user=None, run_after=None):
+    return Job.objects.create(
+        task=task, payload=payload or {}, user=user, run_after=run_after or timezone.now()
+    )
+
+
+def complete(task, result, payload=None, user=None):
+    now = timezone.now()
+    return Job.objects.create(
+        task=task, payload=payload or {}, user=user, status=Job.DONE, result=result,
+        started_time=now, finished_time=now,
+    )
+
+
+def active_job(task):
+    return Job.objects.filter(task=task, status__in=(Job.QUEUED, Job.RUNNING)).order_by("-id").first()
+
+
+def enqueue_once(task, payload=None, user=None):
+    job = active_job(task)
+    if job is None:
+        job = enqueue(task, payload=payload, user=user)
+    return job
+
+
+def schedule(task, interval):
+    """
+    Enqueue ``task`` when it is not already pending and its last run
+    finished more than ``interval`` seconds ago.
+    """
+    if active_job(task) is not None:
+        return None
+    last = Job.objects.filter(task=task).exclude(finished_time=None).order_by("-finished_time").first()
+    if last is not None and last.finished_time > timezone.now() - timedelta(seconds=interval):
+        return None
+    return enqueue(task)
+
+
+def claim_job():
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        status=Job.QUEUED, run_after__lte=now
+    ).order_by("id").values_list("id", flat=True)[:10]
+    for pk in candidates:
+        claimed = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_time=now, heartbeat_time=now, attempts=F("attempts") + 1
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def requeue_stale_jobs():
+    """
+    Requeue the running jobs whose worker stopped sending heartbeats, the
+    ones already claimed JOB_MAX_ATTEMPTS times are marked failed instead.
+    """
+    now = timezone.now()
+    deadline = now - timedelta(seconds=JOB_STALE_AFTER)
+    stale = Job.objects.filter(status=Job.RUNNING).filter(
+        Q(heartbeat_time__lt=deadline) | Q(heartbeat_time=None, started_time__lt=deadline)
+    )
+    failed = stale.filter(attempts__gte=JOB_MAX_ATTEMPTS).update(
+        status=Job.FAILED, finished_time=now, error=f"worker stopped after {JOB_MAX_ATTEMPTS} attempts"
+    )
+    if failed:
+        logger.warning("%s stale jobs reached %s attempts and failed", failed, JOB_MAX_ATTEMPTS)
+    return stale.update(status=Job.QUEUED)
+
+
+class Heartbeat(threading.Thread):
+    """
+    Refresh the heartbeat of a running job every JOB_HEARTBEAT_INTERVAL
+    seconds, so other workers don't take it for stale.
+    """
+
+    def __init__(self, job, interval=JOB_HEARTBEAT_INTERVAL):
+        super().__init__(daemon=True)
+        self.job = job
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                Job.objects.filter(pk=self.job.pk, status=Job.RUNNING).update(heartbeat_time=timezone.now())
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job):
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        func = import_string(job.task)
+        job.result = func(job)
+        job.status = Job.DONE
+    except Exception:
+        logger.exception("job %s (%s) failed", job.id, job.task)
+        job.error = traceback.format_exc()
+        job.status = Job.FAILED
+    finally:
+        heartbeat.stop()
+    job.finished_time = timezone.now()
+    job.save(update_fields=["result", "status", "error", "finished_time"])
+    return job
@@ -0,0 +1,15 @@
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
+
+from apps.job.models import Job
+
+
+@login_required
+def job_status(request, id):
+    try:
+        job = Job.objects.get(id=id)
+    except Job.DoesNotExist:
+        raise Http404
+    if job.user_id != request.user.id and not request.user.is_staff:
+        raise Http404
+    return JsonResponse(job.as_dict())
@@ -0,0 +1,21 @@
+const syncStatus = document.getElementById('syncStatus');
+
+function pollSyncStatus() {
+    fetch(syncStatus.dataset.url)
+        .then(response => response.json())
+        .then(data => {
+            document.getElementById('syncState').textContent = data.status;
+            document.getElementById('syncDone').textContent = data.done;
+            document.getElementById('syncTotal').textContent = data.total;
+            if (data.status === 'queued' || data.status === 'running') {
+                setTimeout(pollSyncStatus, 2000);
+            }
+        })
+        .catch(error => {
+            console.error("خطا در دریافت وضعیت همگام‌سازی:", error);
+        });
+}
+
+if (syncStatus && (syncStatus.dataset.status === 'queued' || syncStatus.dataset.status === 'running')) {
+    pollSyncStatus();
+}
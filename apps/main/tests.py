@@ -1,3 +1,41 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import sys
 
-# Create your tests here.
+from django.conf import settings
+from django.test import SimpleTestCase
+
+# Imported on first use only, never while a worker boots.
+LAZY_MODULES = ("openai", "langchain_openai", "langchain_core", "tiktoken", "pydantic", "pydub", "pandas")
+
+BOOT = """
+import json, sys
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+class StartupImportTests(SimpleTestCase):
+    """
+    Boot a fresh interpreter the way a web worker does and check which
+    modules it has loaded.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "config.settings"))
+        result = subprocess.run(
+            [sys.executable, "-c", BOOT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        cls.modules = {name.split(".")[0] for name in json.loads(result.stdout.splitlines()[-1])}
+
+    def test_llm_stack_is_lazy(self):
+        for module in LAZY_MODULES:
+            with self.subTest(module=module):
+                self.assertNotIn(module, self.modules)
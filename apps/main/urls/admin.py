@@ -1,8 +1,10 @@
+from django.conf import settings
 from django.urls import path
 
-from apps.main.views.admin import admin_manage
+from apps.main.views.admin import aadmin_manage, admin_manage, stats_dashboard
 
 
 urlpatterns = [
-    path("", admin_manage, name="paneladmin"),
+    path("", aadmin_manage if settings.ASYNC_VIEWS else admin_manage, name="paneladmin"),
+    path("stats/", stats_dashboard, name="stats-dashboard"),
 ]
@@ -1,6 +1,14 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import redirect, render
 from django.contrib.admin.views.decorators import staff_member_required
-from apps.report.utils import main
+
+from apps.account.decorators import aget_user, async_staff_member_required
+from apps.job.models import Job
+from apps.job.utils import enqueue_once
+from apps.report.models import QuestionStat, ReportStat
+
+SYNC_TASK = "apps.report.utils.sync_job"
+
 
 def custom_page_not_found(request, exception):
     return render(request, '404.html', status=404)
@@ -14,10 +22,36 @@ def custom_page_server_error(request):
 def admin_manage(request):
     if request.user.is_superuser:
         if request.method == "GET":
-            return render(request, "main/admin.html") 
+            job = Job.objects.filter(task=SYNC_TASK).order_by("-id").first()
+            return render(request, "main/admin.html", {"job": job})
+        if request.method == "POST":
+            enqueue_once(SYNC_TASK, user=request.user)
+            return redirect("paneladmin")
+    return redirect("report-list")
+
+
+@staff_member_required
+def stats_dashboard(request):
+    stats = ReportStat.objects.select_related("report").order_by("-responses")
+    selected, questions = None, []
+    sid = request.GET.get("report")
+    if sid and sid.isdigit():
+        selected = ReportStat.objects.select_related("report").filter(report_id=int(sid)).first()
+        if selected is not None:
+            questions = QuestionStat.objects.filter(report_id=selected.report_id).select_related(
+                "question"
+            ).order_by("question_id")
+    return render(request, "main/stats.html", {"stats": stats, "selected": selected, "questions": questions})
+
+
+@async_staff_member_required
+async def aadmin_manage(request):
+    user = await aget_user(request)
+    if user.is_superuser:
+        if request.method == "GET":
+            job = await Job.objects.filter(task=SYNC_TASK).order_by("-id").afirst()
+            return await sync_to_async(render)(request, "main/admin.html", {"job": job})
         if request.method == "POST":
-            check = main()
-            if check:
-                return redirect("report-list")
+            await sync_to_async(enqueue_once)(SYNC_TASK, user=user)
             return redirect("paneladmin")
     return redirect("report-list")
@@ -1,11 +1,18 @@
 from django.contrib import admin
 from django.contrib.admin import register
-from .models import Answer, Question, Report, Response
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import Answer, Question, QuestionStat, Report, ReportStat, Response
 
 
 @register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
-    list_display = ("response", "question", "answer", "created_time")
+    list_display = ("response", "question", "answer", "response_time")
+    list_select_related = ("response__user", "question__report")
+
+    @admin.display(description="created time", ordering="response__created_time")
+    def response_time(self, obj):
+        return obj.response.created_time
 
 
 @register(Question)
@@ -23,10 +30,28 @@ class QuestionInline(admin.TabularInline):
 
 @register(Report)
 class ReportAdmin(admin.ModelAdmin):
-    list_display = ("sid", "name", "description", "created_time")
+    list_display = ("sid", "name", "description", "created_time", "export")
     inlines = [QuestionInline]
 
+    @admin.display(description="export")
+    def export(self, obj):
+        url = reverse("report-export", args=[obj.sid])
+        return format_html('<a href="{0}?format=csv">CSV</a> / <a href="{0}?format=parquet">Parquet</a>', url)
+
 
 @register(Response)
 class ResponseAdmin(admin.ModelAdmin):
-    list_display = ("id", "report", "user", "created_time")
\ No newline at end of file
+    list_display = ("id", "report", "user", "answer_count", "created_time")
+    list_select_related = ("report", "user")
+
+
+@register(ReportStat)
+class ReportStatAdmin(admin.ModelAdmin):
+    list_display = ("report", "responses", "participants", "answers", "questions", "updated_time")
+    list_select_related = ("report",)
+
+
+@register(QuestionStat)
+class QuestionStatAdmin(admin.ModelAdmin):
+    list_display = ("question", "report", "answers")
+    list_select_related = ("question__report", "report")
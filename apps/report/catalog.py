@@ -0,0 +1,120 @@
+"""
+Cached report catalog and question lists.
+
+Both only change when the LimeSurvey sync (or an admin) edits reports, so
+they are served from the "catalog" cache under a version number that
+:func:`invalidate` replaces. The version is kept in the shared cache and
+memoized in each process for ``CATALOG_LOCAL_TTL`` seconds; the catalog
+itself is also kept in process memory per version, so most page views
+read neither the database nor the shared cache.
+
+The version is the invalidation time in microseconds, which also serves
+as the ``Last-Modified`` of the cached pages. Only the version key never
+expires; the entries of replaced versions expire with the cache TIMEOUT.
+The version outlives deploys, so the ETag of the pages also carries
+:func:`build_id`.
+"""
+import functools
+import hashlib
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count
+from django.template import engines
+from django.utils.connection import ConnectionProxy
+
+from apps.report.models import Question, Report
+
+
+CATALOG_LOCAL_TTL = settings.CATALOG_LOCAL_TTL
+BUILD_ID = settings.BUILD_ID
+VERSION_KEY = "catalog:version"
+
+# Resolved on use, so override_settings(CACHES=...) applies.
+catalog_cache = ConnectionProxy(caches, "catalog")
+
+_lock = threading.Lock()
+_version = (None, 0)
+_local = {}
+
+
+def get_version():
+    global _version
+    version, expiry = _version
+    if version is None or expiry < time.monotonic():
+        version = catalog_cache.get(VERSION_KEY)
+        if version is None:
+            version = int(time.time() * 1e6)
+            # Another process may have set it first, use theirs.
+            if not catalog_cache.add(VERSION_KEY, version, None):
+                version = catalog_cache.get(VERSION_KEY, version)
+        with _lock:
+            if version != _version[0]:
+                # Invalidated, possibly by another process.
+                _local.clear()
+            _version = (version, time.monotonic() + CATALOG_LOCAL_TTL)
+    return version
+
+
+def invalidate():
+    global _version
+    catalog_cache.set(VERSION_KEY, int(time.time() * 1e6), None)
+    with _lock:
+        _version = (None, 0)
+        _local.clear()
+
+
+def last_modified():
+    return get_version() / 1e6
+
+
+@functools.cache
+def build_id():
+    """
+    BUILD_ID, or a digest of the templates the pages are rendered with.
+    """
+    if BUILD_ID:
+        return BUILD_ID
+    digest = hashlib.sha1()
+    for path in sorted(path for root in engines["django"].template_dirs for path in Path(root).rglob("*")):
+        if path.is_file():
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def _get(name, build):
+    version = get_version()
+    key = f"catalog:{version}:{name}"
+    value = _local.get(key)
+    if value is None:
+        value = catalog_cache.get(key)
+        if value is None:
+            value = build()
+            catalog_cache.set(key, value)
+        with _lock:
+            _local[key] = value
+    return value
+
+
+def get_reports():
+    """
+    All reports, each with a ``question_count``.
+    """
+    return _get("reports", lambda: list(Report.objects.annotate(question_count=Count("question_report"))))
+
+
+def get_report(sid):
+    """
+    Return ``(report, questions)`` in question order, or None for an unknown
+    report.
+    """
+    # Unknown ids are answered from the catalog, they neither reach the
+    # database nor add cache entries.
+    if sid not in _get("sids", lambda: {report.sid for report in get_reports()}):
+        return None
+    return _get(f"report:{sid}", lambda: (
+        Report.objects.get(sid=sid), list(Question.objects.filter(report_id=sid).order_by("id"))
+    ))
@@ -0,0 +1,134 @@
+"""
+Wide exports of a report for the researchers: one row per Response, one
+column per Question.
+
+Responses and answers are read with ``.iterator()`` (server-side cursors on
+PostgreSQL) and turned into pandas frames of ``EXPORT_CHUNK_SIZE`` rows, so
+memory stays bounded whatever the size of the report. pandas and pyarrow
+are imported on use only.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from apps.report.models import Answer, Question, Response
+
+
+EXPORT_CHUNK_SIZE = settings.EXPORT_CHUNK_SIZE
+FORMATS = ("csv", "parquet")
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+META_COLUMNS = ["response", "user", "created_time"]
+
+
+def get_columns(report):
+    """
+    Return ``[(question_id, column name), ...]`` in question order.
+    """
+    return list(Question.objects.filter(report=report).order_by("id").values_list("id", "question"))
+
+
+def iter_rows(report, question_ids, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield one list per response: the response id, username, date, then the
+    answers in ``question_ids`` order (None when not answered).
+
+    Responses and answers are both streamed in response order and merged,
+    nothing but the current response is kept in memory.
+    """
+    position = {question_id: index for index, question_id in enumerate(question_ids)}
+    responses = Response.objects.filter(report=report).order_by("id").values_list(
+        "id", "user__username", "created_time"
+    ).iterator(chunk_size=chunk_size)
+    answers = Answer.objects.filter(response__report=report).order_by("response_id").values_list(
+        "response_id", "question_id", "answer"
+    ).iterator(chunk_size=chunk_size)
+    answer = next(answers, None)
+    for response_id, username, created_time in responses:
+        values = [None] * len(position)
+        # Answers of responses that were deleted meanwhile are skipped.
+        while answer is not None and answer[0] <= response_id:
+            if answer[0] == response_id and answer[1] in position:
+                values[position[answer[1]]] = answer[2]
+            answer = next(answers, None)
+        yield [response_id, username, str(created_time), *values]
+
+
+def iter_frames(report, chunk_size=EXPORT_CHUNK_SIZE):
+    import pandas as pd
+
+    columns = get_columns(report)
+    names = META_COLUMNS + [name for _, name in columns]
+    rows, sent = [], False
+    for row in iter_rows(report, [question_id for question_id, _ in columns], chunk_size):
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield pd.DataFrame(rows, columns=names, dtype="string")
+            rows, sent = [], True
+    if rows or not sent:
+        # A report without responses still exports its header.
+        yield pd.DataFrame(rows, columns=names, dtype="string")
+
+
+def iter_csv(report, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the CSV export as text chunks, for a streaming response.
+    """
+    header = True
+    for frame in iter_frames(report, chunk_size):
+        yield frame.to_csv(index=False, header=header)
+        header = False
+
+
+def write_csv(report, out, chunk_size=EXPORT_CHUNK_SIZE):
+    for chunk in iter_csv(report, chunk_size):
+        out.write(chunk)
+
+
+def write_parquet(report, out, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Write the Parquet export to a path or binary file, one row group per
+    chunk.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for frame in iter_frames(report, chunk_size):
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def iter_file(file, block_size=64 * 1024):
+    with file:
+        while data := file.read(block_size):
+            yield data
+
+
+async def aiter_sync(iterator):
+    """
+    Hand the chunks of a sync iterator to an async streaming response one at
+    a time. Under ASGI Django reads a sync streaming iterator to the end
+    before sending anything, which would hold the whole export in memory.
+    """
+    iterator = iter(iterator)
+    done = object()
+    try:
+        # Thread sensitive, so the database cursor stays on one thread.
+        while (chunk := await sync_to_async(next)(iterator, done)) is not done:
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def export_filename(report, format):
+    return f"report-{report.sid}.{format}"
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.report.export import FORMATS, write_csv, write_parquet
+from apps.report.models import Report
+
+
+class Command(BaseCommand):
+    help = "Export the answers of a report, one row per response and one column per question."
+
+    def add_arguments(self, parser):
+        parser.add_argument("sid", type=int, help="LimeSurvey id of the report.")
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument("--output", "-o", help="Output file, CSV goes to stdout when omitted.")
+        parser.add_argument("--chunk-size", type=int, default=None, help="Responses per chunk.")
+
+    def handle(self, *args, **options):
+        try:
+            report = Report.objects.get(sid=options["sid"])
+        except Report.DoesNotExist:
+            raise CommandError(f"report {options['sid']} does not exist")
+        kwargs = {"chunk_size": options["chunk_size"]} if options["chunk_size"] else {}
+        output = options["output"]
+        if options["format"] == "parquet":
+            if not output:
+                raise CommandError("--output is required for parquet")
+            write_parquet(report, output, **kwargs)
+        elif output:
+            with open(output, "w", encoding="utf-8", newline="") as out:
+                write_csv(report, out, **kwargs)
+        else:
+            write_csv(report, sys.stdout, **kwargs)
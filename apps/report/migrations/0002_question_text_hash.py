@@ -0,0 +1,47 @@
+import hashlib
+import unicodedata
+
+from django.db import migrations, models
+
+
+def hash_text(text):
+    text = unicodedata.normalize("NFKC", text)
+    text = text.replace("ي", "ی").replace("ك", "ک").replace("\u200c", " ")
+    return hashlib.sha1(" ".join(text.split()).encode()).hexdigest()
+
+
+def populate_text_hash(apps, schema_editor):
+    Question = apps.get_model("report", "Question")
+    Answer = apps.get_model("report", "Answer")
+    seen = {}
+    for question in Question.objects.order_by("id").iterator():
+        question.text_hash = hash_text(question.question)
+        key = (question.report_id, question.text_hash)
+        if key in seen:
+            # Keep the oldest copy of a duplicated question and move its answers over.
+            Answer.objects.filter(question_id=question.id).update(question_id=seen[key])
+            question.delete()
+            continue
+        seen[key] = question.id
+        question.save(update_fields=["text_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='text_hash',
+            field=models.CharField(default='', editable=False, max_length=40),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_text_hash, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='question',
+            constraint=models.UniqueConstraint(fields=('report', 'text_hash'), name='unique_report_question_hash'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_answer_count(apps, schema_editor):
+    Response = apps.get_model("report", "Response")
+    Answer = apps.get_model("report", "Answer")
+    responses = Response.objects.annotate(total=Count("answer_response")).filter(total__gt=0)
+    for response in responses.iterator():
+        answers = Answer.objects.filter(response=response).order_by("id").values_list("answer", flat=True)
+        text = " | ".join(answer for answer in answers if answer)
+        response.answer_count = response.total
+        response.summary = text if len(text) <= 255 else text[:254] + "…"
+        response.save(update_fields=["answer_count", "summary"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("report", "0002_question_text_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="response",
+            name="answer_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="response",
+            name="summary",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(fill_answer_count, migrations.RunPython.noop),
+    ]
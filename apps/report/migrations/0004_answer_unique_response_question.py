@@ -0,0 +1,49 @@
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_answers(apps, schema_editor):
+    """
+    Keep the newest answer for every (response, question) pair.
+    """
+    Answer = apps.get_model("report", "Answer")
+    duplicates = (
+        Answer.objects.values("response_id", "question_id")
+        .annotate(total=Count("id"), last=Max("id"))
+        .filter(total__gt=1)
+    )
+    for item in duplicates.iterator():
+        Answer.objects.filter(
+            response_id=item["response_id"], question_id=item["question_id"], id__lt=item["last"]
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("report", "0003_response_answer_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_answers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="answer",
+            constraint=models.UniqueConstraint(fields=("response", "question"), name="unique_response_question"),
+        ),
+        migrations.AlterField(
+            model_name="answer",
+            name="response",
+            field=models.ForeignKey(
+                db_index=False, on_delete=models.deletion.CASCADE, related_name="answer_response",
+                to="report.response",
+            ),
+        ),
+        migrations.RemoveField(
+            model_name="answer",
+            name="created_time",
+        ),
+        migrations.AddIndex(
+            model_name="response",
+            index=models.Index(fields=["user", "-id"], name="response_user_id_idx"),
+        ),
+    ]
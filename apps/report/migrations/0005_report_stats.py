@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-18 20:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0004_answer_unique_response_question'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportStat',
+            fields=[
+                ('report', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stat', serialize=False, to='report.report')),
+                ('responses', models.PositiveIntegerField(default=0)),
+                ('participants', models.PositiveIntegerField(default=0)),
+                ('answers', models.PositiveIntegerField(default=0)),
+                ('questions', models.PositiveIntegerField(default=0)),
+                ('updated_time', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionStat',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stat', serialize=False, to='report.question')),
+                ('answers', models.PositiveIntegerField(default=0)),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_stat', to='report.report')),
+            ],
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+from django.db.models import Count
+
+
+def backfill_stats(apps, schema_editor):
+    """
+    Fill the counters of the reports that existed before the statistics,
+    which would otherwise show zeros until the first rollup. A copy of
+    apps.report.stats.rollup on the historical models.
+    """
+    Answer = apps.get_model("report", "Answer")
+    Question = apps.get_model("report", "Question")
+    QuestionStat = apps.get_model("report", "QuestionStat")
+    Report = apps.get_model("report", "Report")
+    ReportStat = apps.get_model("report", "ReportStat")
+    Response = apps.get_model("report", "Response")
+
+    responses = {
+        item["report_id"]: item
+        for item in Response.objects.values("report_id").annotate(
+            total=Count("id"), users=Count("user", distinct=True)
+        ).order_by()
+    }
+    answers = dict(Answer.objects.values_list("response__report_id").annotate(total=Count("id")).order_by())
+    questions = dict(Question.objects.values_list("report_id").annotate(total=Count("id")).order_by())
+    ReportStat.objects.bulk_create(
+        [
+            ReportStat(
+                report_id=sid,
+                responses=responses.get(sid, {}).get("total", 0),
+                participants=responses.get(sid, {}).get("users", 0),
+                answers=answers.get(sid, 0),
+                questions=questions.get(sid, 0),
+            )
+            for sid in Report.objects.values_list("sid", flat=True)
+        ],
+        update_conflicts=True,
+        unique_fields=["report"],
+        update_fields=["responses", "participants", "answers", "questions", "updated_time"],
+        batch_size=500,
+    )
+
+    question_answers = dict(Answer.objects.values_list("question_id").annotate(total=Count("id")).order_by())
+    QuestionStat.objects.bulk_create(
+        [
+            QuestionStat(question_id=question_id, report_id=report_id, answers=question_answers.get(question_id, 0))
+            for question_id, report_id in Question.objects.values_list("id", "report_id")
+        ],
+        update_conflicts=True,
+        unique_fields=["question"],
+        update_fields=["answers"],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0006_limesurvey_responses'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 21:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0007_backfill_report_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='pending_responses',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,3 +1,6 @@
+import hashlib
+import unicodedata
+
 from django.db import models
 from django.contrib.auth.models import User
 from django_jalali.db import models as jmodels
@@ -8,6 +11,10 @@ class Report(models.Model):
     name = models.CharField(max_length=480)
     description = models.TextField(blank=True)
     created_time = jmodels.jDateField()
+    # Highest LimeSurvey response id exported so far.
+    last_response_id = models.PositiveIntegerField(default=0)
+    # LimeSurvey responses below it still in progress, {id: time first seen}.
+    pending_responses = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return self.name
@@ -16,25 +23,103 @@ class Report(models.Model):
 class Question(models.Model):
     report = models.ForeignKey(Report, related_name="question_report", on_delete=models.CASCADE)
     question = models.TextField()
+    text_hash = models.CharField(max_length=40, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["report", "text_hash"], name="unique_report_question_hash"),
+        ]
 
     def __str__(self):
         return f"{self.report} - {self.question}"
 
+    @staticmethod
+    def normalize_text(text):
+        text = unicodedata.normalize("NFKC", text)
+        text = text.replace("ي", "ی").replace("ك", "ک").replace("\u200c", " ")
+        return " ".join(text.split())
+
+    @classmethod
+    def hash_text(cls, text):
+        return hashlib.sha1(cls.normalize_text(text).encode()).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.text_hash = self.hash_text(self.question)
+        super().save(*args, **kwargs)
+
 
 class Response(models.Model):
     report = models.ForeignKey(Report, related_name="response_report", on_delete=models.CASCADE)
-    user = models.ForeignKey(User, related_name="response_user", on_delete=models.CASCADE)
+    # Empty for responses imported from LimeSurvey whose token matches no user.
+    user = models.ForeignKey(User, related_name="response_user", on_delete=models.CASCADE, null=True, blank=True)
     created_time = jmodels.jDateField()
+    # LimeSurvey response id of imported responses.
+    external_id = models.PositiveIntegerField(null=True, blank=True)
+    # Maintained by RegisterAnswer.save_answer, so list pages don't touch Answer.
+    answer_count = models.PositiveIntegerField(default=0)
+    summary = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-id"], name="response_user_id_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["report", "external_id"], name="unique_report_external_response"),
+        ]
 
     def __str__(self):
         return f'{self.user} - response: {self.id}'
 
+    @staticmethod
+    def summarize(answers, length=255):
+        text = " | ".join(str(answer) for answer in answers if answer)
+        return text if len(text) <= length else text[:length - 1] + "…"
+
 
 class Answer(models.Model):
-    response = models.ForeignKey(Response, related_name="answer_response", on_delete=models.CASCADE)
+    # Lookups by response use the (response, question) unique index.
+    response = models.ForeignKey(Response, related_name="answer_response", on_delete=models.CASCADE, db_index=False)
     question = models.ForeignKey(Question, related_name="answer_question", on_delete=models.CASCADE)
     answer = models.TextField()
-    created_time = jmodels.jDateField()
-    
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["response", "question"], name="unique_response_question"),
+        ]
+
     def __str__(self):
         return f"{self.question} - {self.answer}"
+
+
+class ReportStat(models.Model):
+    """
+    Running totals of a report, maintained by apps.report.stats on every
+    response and recomputed by its periodic rollup.
+    """
+
+    report = models.OneToOneField(Report, on_delete=models.CASCADE, primary_key=True, related_name="stat")
+    responses = models.PositiveIntegerField(default=0)
+    participants = models.PositiveIntegerField(default=0)
+    answers = models.PositiveIntegerField(default=0)
+    questions = models.PositiveIntegerField(default=0)
+    updated_time = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.report} - {self.responses}"
+
+    @property
+    def fill_rate(self):
+        """
+        Share of the questions answered, over all responses.
+        """
+        expected = self.responses * self.questions
+        return self.answers / expected if expected else 0
+
+
+class QuestionStat(models.Model):
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, primary_key=True, related_name="stat")
+    report = models.ForeignKey(Report, on_delete=models.CASCADE, related_name="question_stat")
+    answers = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.question} - {self.answers}"
@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.report import catalog, stats
+from apps.report.models import Answer, Question, Report, Response
+
+
+@receiver(post_save, sender=Report)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Report)
+@receiver(post_delete, sender=Question)
+def catalog_changed(sender, instance, update_fields=None, **kwargs):
+    # The response import only moves the high-water mark.
+    if update_fields and set(update_fields) <= {"last_response_id", "pending_responses"}:
+        return
+    transaction.on_commit(catalog.invalidate)
+
+
+def deleting_report(origin):
+    # The counters of a deleted report go with it.
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is Report
+
+
+@receiver(pre_delete, sender=Response)
+def response_deleting(sender, instance, origin=None, **kwargs):
+    if deleting_report(origin):
+        return
+    # The answers are gone by post_delete.
+    instance._answered = list(Answer.objects.filter(response=instance).values_list("question_id", flat=True))
+
+
+@receiver(post_delete, sender=Response)
+def response_deleted(sender, instance, origin=None, **kwargs):
+    if deleting_report(origin):
+        return
+    stats.forget_response(instance, getattr(instance, "_answered", []))
@@ -40,6 +40,7 @@ async function transferVoiceToText(voice) {
     const formData = new FormData();
     const question = document.querySelector("#question").textContent;
     formData.append("audio_file", voice);
+    formData.append("report_sid", report_sid);
     return fetch(BASE_URL + '/voice/speech-to-text/', {
         method: 'POST',
         headers: {
@@ -47,16 +48,69 @@ async function transferVoiceToText(voice) {
         },
         body: formData
     })
-    .then(response => response.json())
-    .then(data => {
-        responses.push({[question]: data["success"]});
-        return data["success"];
+    .then(response => {
+        if (!response.ok) {
+            throw new Error("خطا در ارسال صدا");
+        }
+        return response.json();
+    })
+    .then(data => waitForJob(data["events_url"]))
+    .then(text => {
+        responses.push({[question]: text});
+        return text;
     })
     .catch(error => {
         return error
     });
 }
 
+// دریافت زنده متن و پاسخ‌های استخراج شده از سرور
+function waitForJob(url) {
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(BASE_URL + url);
+        let transcribed = false;
+        source.addEventListener("transcript", event => {
+            transcribed = true;
+            resolve(JSON.parse(event.data)["text"]);
+        });
+        source.addEventListener("answer", event => {
+            const data = JSON.parse(event.data);
+            showAnswer(data["question"], data["answer"]);
+        });
+        source.addEventListener("done", () => source.close());
+        source.addEventListener("failed", () => {
+            source.close();
+            reject(new Error("خطا در پردازش صدا"));
+        });
+        source.addEventListener("timeout", () => {
+            source.close();
+            reject(new Error("پردازش صدا بیش از حد طول کشید"));
+        });
+        // The stream could not be opened or was cut, EventSource would
+        // otherwise keep reconnecting and the promise never settle.
+        source.onerror = () => {
+            if (!transcribed) {
+                source.close();
+                reject(new Error("ارتباط با سرور قطع شد"));
+            }
+        };
+    });
+}
+
+function showAnswer(questionId, answer) {
+    const questionItem = document.querySelector(`#questions li[data-id="${questionId}"]`);
+    if (!questionItem) {
+        return;
+    }
+    let item = document.querySelector(`#extracted li[data-id="${questionId}"]`);
+    if (!item) {
+        item = document.createElement("li");
+        item.dataset.id = questionId;
+        document.querySelector("#extracted").appendChild(item);
+    }
+    item.textContent = `${questionItem.textContent}: ${answer}`;
+}
+
 let next = document.querySelector("#next")
 let counter = 0
 let question = document.querySelector("#question")
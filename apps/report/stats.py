@@ -0,0 +1,119 @@
+"""
+Per-report and per-question counters for the statistics dashboard.
+
+They are updated incrementally when a response is saved or deleted. A
+periodic rollup recomputes them from the tables, which also accounts for
+questions added by the LimeSurvey sync and for bulk changes that bypass
+the model signals.
+"""
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from apps.report.models import Answer, Question, QuestionStat, Report, ReportStat, Response
+
+
+def record_response(response, question_ids):
+    """
+    Add a new response, answering ``question_ids``, to the counters.
+    """
+    report_id = response.report_id
+    # Imported responses have no user and, as in the rollup, no participant.
+    first = response.user_id is not None and not Response.objects.filter(
+        report_id=report_id, user_id=response.user_id
+    ).exclude(id=response.id).exists()
+    ReportStat.objects.get_or_create(
+        report_id=report_id, defaults={"questions": Question.objects.filter(report_id=report_id).count()}
+    )
+    ReportStat.objects.filter(report_id=report_id).update(
+        responses=F("responses") + 1,
+        participants=F("participants") + int(first),
+        answers=F("answers") + len(question_ids),
+    )
+    if question_ids:
+        QuestionStat.objects.bulk_create(
+            [QuestionStat(question_id=question_id, report_id=report_id) for question_id in question_ids],
+            ignore_conflicts=True,
+        )
+        QuestionStat.objects.filter(question_id__in=question_ids).update(answers=F("answers") + 1)
+
+
+def forget_response(response, question_ids):
+    """
+    Remove a deleted response, that answered ``question_ids``, from the
+    counters. Called after the delete, see apps.report.signals.
+    """
+    report_id = response.report_id
+    last = response.user_id is not None and not Response.objects.filter(
+        report_id=report_id, user_id=response.user_id
+    ).exists()
+    # Never below zero, counters created after the response was saved lag behind.
+    ReportStat.objects.filter(report_id=report_id).update(
+        responses=Greatest(F("responses") - 1, 0),
+        participants=Greatest(F("participants") - int(last), 0),
+        answers=Greatest(F("answers") - len(question_ids), 0),
+    )
+    if question_ids:
+        QuestionStat.objects.filter(question_id__in=question_ids).update(answers=Greatest(F("answers") - 1, 0))
+
+
+def rollup(report_ids=None):
+    """
+    Recompute the counters of ``report_ids`` (all reports when None) with
+    one grouped query per counter.
+    """
+    reports = Report.objects.all()
+    if report_ids is not None:
+        reports = reports.filter(sid__in=list(report_ids))
+    sids = list(reports.values_list("sid", flat=True))
+
+    responses = {
+        item["report_id"]: item
+        for item in Response.objects.filter(report_id__in=sids).values("report_id").annotate(
+            total=Count("id"), users=Count("user", distinct=True)
+        ).order_by()
+    }
+    answers = dict(
+        Answer.objects.filter(response__report_id__in=sids).values_list("response__report_id").annotate(
+            total=Count("id")
+        ).order_by()
+    )
+    questions = dict(
+        Question.objects.filter(report_id__in=sids).values_list("report_id").annotate(total=Count("id")).order_by()
+    )
+    ReportStat.objects.bulk_create(
+        [
+            ReportStat(
+                report_id=sid,
+                responses=responses.get(sid, {}).get("total", 0),
+                participants=responses.get(sid, {}).get("users", 0),
+                answers=answers.get(sid, 0),
+                questions=questions.get(sid, 0),
+            )
+            for sid in sids
+        ],
+        update_conflicts=True,
+        unique_fields=["report"],
+        update_fields=["responses", "participants", "answers", "questions", "updated_time"],
+        batch_size=500,
+    )
+
+    question_answers = dict(
+        Answer.objects.filter(question__report_id__in=sids).values_list("question_id").annotate(
+            total=Count("id")
+        ).order_by()
+    )
+    QuestionStat.objects.bulk_create(
+        [
+            QuestionStat(question_id=question_id, report_id=report_id, answers=question_answers.get(question_id, 0))
+            for question_id, report_id in Question.objects.filter(report_id__in=sids).values_list("id", "report_id")
+        ],
+        update_conflicts=True,
+        unique_fields=["question"],
+        update_fields=["answers"],
+        batch_size=1000,
+    )
+    return {"reports": len(sids)}
+
+
+def rollup_job(job):
+    return rollup()
@@ -1,3 +1,714 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import importlib
+import io
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import jdatetime
+from tenacity import wait_none
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.report import catalog, export, stats, utils
+from apps.report.models import Answer, Question, QuestionStat, Report, ReportStat, Response
+from apps.report.views import admin as admin_views, front
+
+
+# The file cache belongs to the running site, tests use a memory one.
+TEST_CACHES = dict(
+    settings.CACHES, catalog={"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "catalog"}
+)
+
+
+def survey(sid, title):
+    return {"sid": str(sid), "surveyls_title": title}
+
+
+class FakeClient:
+    """
+    In-memory stand-in for LimeSurveyClient.batch, keyed by survey id.
+    """
+
+    batching = True
+
+    def __init__(self, surveys, questions):
+        self.surveys = surveys
+        self.questions = questions
+        self.batches = []
+
+    def list_surveys(self):
+        return self.surveys
+
+    def batch(self, calls):
+        self.batches.append(calls)
+        return [self.questions.get(int(sid), {"status": "No questions found"}) for _, sid in calls]
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SyncSurveysTests(TestCase):
+
+    def setUp(self):
+        caches["catalog"].clear()
+
+    def sync(self, surveys):
+        with self.captureOnCommitCallbacks(execute=True):
+            return utils.sync_surveys(surveys)
+
+    def test_creates_reports_and_questions(self):
+        result = self.sync({
+            1: (survey(1, "first"), [{"question": "q1"}, {"question": "q2"}]),
+            2: (survey(2, "second"), []),
+        })
+        self.assertEqual(result, {"reports_created": 2, "reports_updated": 0, "questions_created": 2})
+        self.assertEqual(Report.objects.get(sid=1).name, "first")
+        self.assertEqual(list(Question.objects.filter(report_id=1).values_list("question", flat=True)), ["q1", "q2"])
+
+    def test_renames_and_adds_without_duplicating(self):
+        self.sync({1: (survey(1, "first"), [{"question": "q1"}])})
+        kept = Question.objects.get(report_id=1)
+        result = self.sync({1: (survey(1, "renamed"), [{"question": "q1"}, {"question": "q2"}])})
+        self.assertEqual(result, {"reports_created": 0, "reports_updated": 1, "questions_created": 1})
+        self.assertEqual(Report.objects.get(sid=1).name, "renamed")
+        self.assertTrue(Question.objects.filter(pk=kept.pk).exists())
+        self.assertEqual(Question.objects.filter(report_id=1).count(), 2)
+
+    def test_unchanged_sync_writes_nothing(self):
+        surveys = {1: (survey(1, "first"), [{"question": "q1"}])}
+        self.sync(surveys)
+        with self.assertNumQueries(4):
+            # One read for the reports and one for the question hashes,
+            # inside the savepoint of the atomic block.
+            result = utils.sync_surveys(surveys)
+        self.assertEqual(result, {"reports_created": 0, "reports_updated": 0, "questions_created": 0})
+
+    def test_same_text_is_one_question(self):
+        # Differences in Arabic/Persian letters and spacing hash the same.
+        self.sync({1: (survey(1, "first"), [{"question": "سوال  يك"}, {"question": "سوال یک"}])})
+        self.assertEqual(Question.objects.filter(report_id=1).count(), 1)
+
+    def test_sync_invalidates_the_shared_question_map(self):
+        self.sync({1: (survey(1, "first"), [{"question": "q1"}])})
+        self.assertEqual(len(utils.get_question_map(1)), 1)
+        old_key = utils.question_map_key(1)
+        self.sync({1: (survey(1, "first"), [{"question": "q1"}, {"question": "q2"}])})
+        # The sync moves the map to a new key, readers of the old one keep it.
+        self.assertNotEqual(utils.question_map_key(1), old_key)
+        self.assertEqual(len(caches["catalog"].get(old_key)), 1)
+        self.assertIn(Question.hash_text("q2"), utils.get_question_map(1))
+
+    def test_fetch_surveys_batches_and_reports_progress(self):
+        client = FakeClient(
+            [survey(sid, f"s{sid}") for sid in range(1, 4)], {1: [{"question": "q1"}], 2: [{"question": "q2"}]}
+        )
+        progress = []
+        result = utils.fetch_surveys(client, lambda done, total=None: progress.append((done, total)))
+        self.assertEqual(sorted(result), [1, 2, 3])
+        self.assertEqual(result[3][1], [])
+        self.assertEqual(len(client.batches), 1)
+        self.assertEqual(progress, [(0, 3), (3, None)])
+
+
+class ImportClient:
+    """
+    Stand-in for the export calls of LimeSurveyClient, ``rows`` are the
+    responses of each survey as dicts.
+    """
+
+    def __init__(self, questions, rows):
+        self.questions = questions
+        self.rows = rows
+        self.exports = []
+
+    def list_questions(self, sid):
+        return self.questions[sid]
+
+    def export_responses(self, sid, from_id=None, to_id=None):
+        self.exports.append((from_id, to_id))
+        if isinstance(self.rows[sid], Exception):
+            raise self.rows[sid]
+        rows = [row for row in self.rows[sid] if (from_id or 0) <= row["id"] <= (to_id or row["id"])]
+        if not rows:
+            return None
+        output = io.StringIO()
+        writer = csv.DictWriter(output, ["id", "submitdate", "token", "Q1", "Q2"])
+        writer.writeheader()
+        writer.writerows(rows)
+        return base64.b64encode(output.getvalue().encode()).decode()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ImportResponsesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="token1")
+        cls.report = Report.objects.create(sid=1, name="daily", created_time=jdatetime.date.today())
+        cls.sleep = Question.objects.create(report=cls.report, question="خواب")
+        cls.questions = {1: [
+            {"title": "Q1", "question": "خواب", "parent_qid": "0"},
+            {"title": "Q2", "question": "غذا", "parent_qid": "0"},
+        ]}
+
+    def setUp(self):
+        caches["catalog"].clear()
+
+    def row(self, id, submitted=True, answer="کم"):
+        return {"id": id, "submitdate": "2026-10-18 10:00:00" if submitted else "", "token": "token1", "Q1": answer}
+
+    def test_responses_in_progress_are_imported_once_submitted(self):
+        rows = [self.row(1), self.row(2, submitted=False), self.row(3)]
+        client = ImportClient(self.questions, {1: rows})
+        self.assertEqual(utils.import_responses(client, self.report), 2)
+        self.report.refresh_from_db()
+        self.assertEqual(self.report.last_response_id, 3)
+        self.assertEqual(list(self.report.pending_responses), ["2"])
+
+        rows[1] = self.row(2)
+        self.assertEqual(utils.import_responses(client, self.report), 1)
+        self.report.refresh_from_db()
+        self.assertEqual(self.report.last_response_id, 3)
+        self.assertEqual(self.report.pending_responses, {})
+        self.assertEqual(
+            sorted(Response.objects.filter(report=self.report).values_list("external_id", flat=True)), [1, 2, 3]
+        )
+        self.assertEqual(Response.objects.get(external_id=1).user, self.user)
+
+    def test_abandoned_response_does_not_hold_the_mark(self):
+        rows = [self.row(1, submitted=False)] + [self.row(id) for id in range(2, 12)]
+        client = ImportClient(self.questions, {1: rows})
+        with mock.patch.object(utils, "LIMESURVEY_IMPORT_BATCH_SIZE", 3):
+            self.assertEqual(utils.import_responses(client, self.report), 10)
+        self.report.refresh_from_db()
+        self.assertEqual(self.report.last_response_id, 11)
+
+        # Later runs export the new responses and the one in progress only.
+        rows.extend([self.row(12), self.row(13, submitted=False)])
+        client.exports.clear()
+        self.assertEqual(utils.import_responses(client, self.report), 1)
+        self.assertEqual(client.exports, [(12, None), (1, 1)])
+        self.report.refresh_from_db()
+        self.assertEqual((self.report.last_response_id, list(self.report.pending_responses)), (13, ["1", "13"]))
+
+        # Never submitted, it is dropped after LIMESURVEY_PENDING_MAX_AGE.
+        self.report.pending_responses["1"] -= utils.LIMESURVEY_PENDING_MAX_AGE
+        client.exports.clear()
+        self.assertEqual(utils.import_responses(client, self.report), 0)
+        self.assertEqual(client.exports, [(14, None), (13, 13)])
+        self.report.refresh_from_db()
+        self.assertEqual(list(self.report.pending_responses), ["13"])
+
+    def test_codes_of_the_same_question_are_one_answer(self):
+        questions = {1: [
+            {"title": "Q1", "question": "خواب", "parent_qid": "0"},
+            {"title": "Q2", "question": " خواب ", "parent_qid": "0"},
+        ]}
+        row = dict(self.row(1), Q2="زیاد")
+        self.assertEqual(utils.import_responses(ImportClient(questions, {1: [row]}), self.report), 1)
+        response = Response.objects.get(external_id=1)
+        self.assertEqual(list(Answer.objects.filter(response=response).values_list("answer", flat=True)), ["زیاد"])
+        self.assertEqual(response.answer_count, 1)
+
+    def test_failing_report_does_not_stop_the_others(self):
+        Report.objects.create(sid=2, name="weekly", created_time=jdatetime.date.today())
+        client = ImportClient(self.questions, {1: [self.row(1)], 2: utils.LimeSurveyError("broken")})
+        with mock.patch.object(utils, "get_client", return_value=client), \
+                mock.patch.object(utils.logger, "disabled", True):
+            result = utils.import_all()
+        self.assertEqual(result, {"responses_imported": 1, "reports": 1, "failed": [2]})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MyReportsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="participant")
+        other = User.objects.create(username="other")
+        cls.report = Report.objects.create(sid=1, name="daily", created_time=jdatetime.date.today())
+        cls.responses = [
+            Response.objects.create(report=cls.report, user=cls.user, created_time=jdatetime.date.today())
+            for _ in range(5)
+        ]
+        Response.objects.create(report=cls.report, user=other, created_time=jdatetime.date.today())
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.enterContext(mock.patch.object(front, "MY_REPORTS_PAGE_SIZE", 2))
+
+    def page(self, before=None):
+        response = self.client.get(reverse("my-reports-list"), {"before": before} if before else {})
+        return [item.id for item in response.context["responses"]], response.context["next_before"]
+
+    def test_pages_follow_the_cursor(self):
+        ids = [response.id for response in reversed(self.responses)]
+        self.assertEqual(self.page(), (ids[:2], ids[1]))
+        self.assertEqual(self.page(ids[1]), (ids[2:4], ids[3]))
+        self.assertEqual(self.page(ids[3]), (ids[4:], None))
+
+    def test_new_responses_do_not_shift_the_next_page(self):
+        ids, before = self.page()
+        Response.objects.create(report=self.report, user=self.user, created_time=jdatetime.date.today())
+        next_ids, _ = self.page(before)
+        self.assertEqual(next_ids, [self.responses[2].id, self.responses[1].id])
+        self.assertFalse(set(ids) & set(next_ids))
+
+    def test_invalid_cursor_is_the_first_page(self):
+        self.assertEqual(self.page("abc"), self.page())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="staff", is_staff=True)
+        cls.report = Report.objects.create(sid=1, name="daily", created_time=jdatetime.date.today())
+        sleep = Question.objects.create(report=cls.report, question="خواب")
+        food = Question.objects.create(report=cls.report, question="غذا")
+        for index in range(5):
+            response = Response.objects.create(report=cls.report, user=cls.staff, created_time=jdatetime.date.today())
+            Answer.objects.create(response=response, question=sleep, answer=f"{index} ساعت")
+            if index % 2:
+                Answer.objects.create(response=response, question=food, answer="برنج")
+
+    def request(self, factory, format="csv"):
+        request = factory.get(f"/export/?format={format}")
+        request.user = self.staff
+        return request
+
+    def small_chunks(self, produced):
+        def iter_csv(report):
+            for chunk in export.iter_csv(report, chunk_size=2):
+                produced.append(chunk)
+                yield chunk
+        return mock.patch.object(admin_views, "iter_csv", iter_csv)
+
+    def test_csv(self):
+        response = admin_views.export_report(self.request(RequestFactory()), self.report.sid)
+        rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ["response", "user", "created_time", "خواب", "غذا"])
+        self.assertEqual([row[3:] for row in rows[1:3]], [["0 ساعت", ""], ["1 ساعت", "برنج"]])
+        self.assertEqual(len(rows), 6)
+
+    async def test_async_csv_is_streamed_in_chunks(self):
+        produced = []
+        with self.small_chunks(produced):
+            response = await admin_views.aexport_report(self.request(AsyncRequestFactory()), self.report.sid)
+            self.assertTrue(response.is_async)
+            content = response.streaming_content
+            first = await content.__anext__()
+            # Nothing past the first chunk has been read yet.
+            self.assertEqual([chunk.encode() for chunk in produced], [first])
+            chunks = [first] + [chunk async for chunk in content]
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(sum(chunk.count(b"\n") for chunk in chunks), 6)
+
+    async def test_async_parquet(self):
+        import pyarrow.parquet as pq
+
+        request = self.request(AsyncRequestFactory(), "parquet")
+        response = await admin_views.aexport_report(request, self.report.sid)
+        data = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(response["Content-Length"], str(len(data)))
+        table = pq.read_table(io.BytesIO(data))
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.column_names[3:], ["خواب", "غذا"])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class StatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username="staff", is_staff=True)
+        cls.users = [User.objects.create(username=f"user{index}") for index in range(2)]
+        cls.report = Report.objects.create(sid=1, name="daily", created_time=jdatetime.date.today())
+        cls.questions = [
+            Question.objects.create(report=cls.report, question=text) for text in ("خواب", "غذا", "ورزش")
+        ]
+
+    def respond(self, user, questions):
+        response = Response.objects.create(report=self.report, user=user, created_time=jdatetime.date.today())
+        Answer.objects.bulk_create([Answer(response=response, question=question, answer="x") for question in questions])
+        stats.record_response(response, [question.id for question in questions])
+        return response
+
+    def counters(self):
+        report = ReportStat.objects.get(report=self.report)
+        return (
+            (report.responses, report.participants, report.answers, report.questions),
+            dict(QuestionStat.objects.values_list("question_id", "answers")),
+        )
+
+    def test_rollup(self):
+        self.respond(self.users[0], self.questions[:2])
+        self.respond(self.users[0], self.questions[:1])
+        self.respond(self.users[1], [])
+        ReportStat.objects.all().delete()
+        QuestionStat.objects.all().delete()
+        stats.rollup()
+        sleep, food, sport = self.questions
+        self.assertEqual(self.counters(), ((3, 2, 3, 3), {sleep.id: 2, food.id: 1, sport.id: 0}))
+
+    def test_incremental_counters_match_the_rollup(self):
+        first = self.respond(self.users[0], self.questions[:2])
+        self.respond(self.users[0], self.questions[:1])
+        second = self.respond(self.users[1], self.questions)
+        first.delete()
+        Response.objects.filter(pk=second.pk).delete()
+        incremental = self.counters()
+        stats.rollup()
+        self.assertEqual(incremental, self.counters())
+        self.assertEqual(incremental[0], (1, 1, 1, 3))
+
+    def test_responses_without_user_are_not_participants(self):
+        self.respond(self.users[0], self.questions[:1])
+        imported = self.respond(None, self.questions[:1])
+        self.assertEqual(self.counters()[0][:2], (2, 1))
+        imported.delete()
+        self.assertEqual(self.counters()[0], (1, 1, 1, 3))
+        stats.rollup()
+        self.assertEqual(self.counters()[0], (1, 1, 1, 3))
+
+    def test_migration_backfills_existing_reports(self):
+        self.respond(self.users[0], self.questions[:2])
+        self.respond(None, self.questions[:1])
+        ReportStat.objects.all().delete()
+        QuestionStat.objects.all().delete()
+        migration = importlib.import_module("apps.report.migrations.0007_backfill_report_stats")
+        migration.backfill_stats(global_apps, None)
+        sleep, food, sport = self.questions
+        self.assertEqual(self.counters(), ((2, 1, 3, 3), {sleep.id: 2, food.id: 1, sport.id: 0}))
+
+    def test_deleting_the_report_skips_the_counters(self):
+        self.respond(self.users[0], self.questions)
+        with CaptureQueriesContext(connection) as context:
+            self.report.delete()
+        self.assertFalse([query for query in context.captured_queries if "UPDATE" in query["sql"]])
+
+    def test_dashboard(self):
+        self.respond(self.users[0], self.questions[:2])
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("stats-dashboard"), {"report": self.report.sid})
+        self.assertEqual([stat.report_id for stat in response.context["stats"]], [self.report.sid])
+        self.assertEqual(response.context["selected"].fill_rate, 2 / 3)
+        self.assertEqual([stat.answers for stat in response.context["questions"]], [1, 1])
+        self.assertContains(response, "67%")
+
+    def test_dashboard_is_for_staff(self):
+        self.client.force_login(self.users[0])
+        self.assertEqual(self.client.get(reverse("stats-dashboard")).status_code, 302)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="participant")
+        cls.report = Report.objects.create(sid=1, name="daily", created_time=jdatetime.date.today())
+        Question.objects.create(report=cls.report, question="خواب")
+
+    def setUp(self):
+        caches["catalog"].clear()
+        catalog.invalidate()
+        self.client.force_login(self.user)
+
+    def test_warm_catalog_runs_no_queries(self):
+        catalog.get_reports()
+        catalog.get_report(1)
+        with self.assertNumQueries(0):
+            self.assertEqual([report.question_count for report in catalog.get_reports()], [1])
+            report, questions = catalog.get_report(1)
+            self.assertEqual([question.question for question in questions], ["خواب"])
+            # Unknown reports are answered from the catalog too.
+            self.assertIsNone(catalog.get_report(2))
+
+    def test_entries_expire_but_the_version_does_not(self):
+        catalog.get_reports()
+        version = catalog.get_version()
+        cache = caches["catalog"]
+        self.assertIsNotNone(cache.get(catalog.VERSION_KEY))
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            catalog.invalidate()
+            catalog.get_reports()
+        (version_call, entry_call) = cache_set.call_args_list
+        self.assertEqual(version_call.args[0], catalog.VERSION_KEY)
+        self.assertIsNone(version_call.args[2])
+        self.assertEqual(entry_call.args, (f"catalog:{catalog.get_version()}:reports", mock.ANY))
+        self.assertIsNotNone(cache.default_timeout)
+        self.assertNotEqual(catalog.get_version(), version)
+
+    def test_not_modified(self):
+        response = self.client.get(reverse("report-list"))
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        response = self.client.get(reverse("report-list"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse("report-detail", args=[1]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_deploy_changes_the_etag(self):
+        etag = self.client.get(reverse("report-list"))["ETag"]
+        self.addCleanup(catalog.build_id.cache_clear)
+        catalog.build_id.cache_clear()
+        with mock.patch.object(catalog, "BUILD_ID", "next"):
+            response = self.client.get(reverse("report-list"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_sync_invalidates_the_catalog(self):
+        response = self.client.get(reverse("report-list"))
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.sync_surveys({2: (survey(2, "weekly"), [{"question": "q1"}])})
+        self.assertEqual([report.sid for report in catalog.get_reports()], [1, 2])
+        self.assertIsNotNone(catalog.get_report(2))
+        response = self.client.get(reverse("report-list"), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_edits_invalidate_the_catalog(self):
+        catalog.get_report(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.create(report=self.report, question="غذا")
+        self.assertEqual(len(catalog.get_report(1)[1]), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Report.objects.filter(sid=1).first().delete()
+        self.assertEqual(catalog.get_reports(), [])
+
+    def test_high_water_mark_keeps_the_catalog(self):
+        version = catalog.get_version()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.report.last_response_id = 10
+            self.report.save(update_fields=["last_response_id"])
+        self.assertEqual(callbacks, [])
+        self.assertEqual(catalog.get_version(), version)
+
+
+class RemoteControlHandler(BaseHTTPRequestHandler):
+    """
+    Minimal LimeSurvey RemoteControl server. The first session key it hands
+    out is rejected as invalid, ``fail`` answers with that many 503 errors.
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server.requests.append(body)
+        if server.fail:
+            server.fail -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        result = [self.call(item) for item in body] if isinstance(body, list) else self.call(body)
+        data = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def call(self, item):
+        method, params = item["method"], item["params"]
+        server = self.server
+        if method == "get_session_key":
+            server.logins += 1
+            result = f"key{server.logins}"
+        elif params[0] == "key1" and server.reject_first_key:
+            result = {"status": "Invalid session key"}
+        elif method == "list_surveys":
+            result = [{"sid": "1", "surveyls_title": "first"}]
+        elif method == "list_questions":
+            result = [{"question": f"question of {params[1]}"}]
+        else:
+            result = None
+        return {"id": item["id"], "result": result, "error": None}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class LimeSurveyClientTests(TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RemoteControlHandler)
+        self.server.requests, self.server.logins, self.server.fail = [], 0, 0
+        self.server.reject_first_key = False
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        url = f"http://127.0.0.1:{self.server.server_port}/"
+        self.client = utils.LimeSurveyClient(url=url, username="u", password="p", timeout=5, batching=True)
+        self.addCleanup(self.client.close)
+        # The session key is shared by the class.
+        utils.LimeSurveyClient._session_key = None
+        self.addCleanup(setattr, utils.LimeSurveyClient, "_session_key", None)
+        utils.AsyncLimeSurveyClient._session_key = None
+        self.addCleanup(setattr, utils.AsyncLimeSurveyClient, "_session_key", None)
+
+    def methods(self):
+        return [item["method"] for item in self.server.requests if isinstance(item, dict)]
+
+    def test_session_key_is_reused(self):
+        self.client.list_surveys()
+        self.client.list_questions(1)
+        self.assertEqual(self.server.logins, 1)
+        self.assertEqual(self.methods(), ["get_session_key", "list_surveys", "list_questions"])
+
+    def test_invalid_session_logs_in_again(self):
+        self.server.reject_first_key = True
+        self.assertEqual(self.client.list_surveys(), [{"sid": "1", "surveyls_title": "first"}])
+        self.assertEqual(self.server.logins, 2)
+
+    def test_batch_is_one_request(self):
+        results = self.client.batch([("list_questions", 1), ("list_questions", 2)])
+        self.assertEqual(results, [[{"question": "question of 1"}], [{"question": "question of 2"}]])
+        self.assertEqual(len([item for item in self.server.requests if isinstance(item, list)]), 1)
+
+    def test_unavailable_server_is_retried(self):
+        self.server.fail = 2
+        with mock.patch.object(utils.LimeSurveyClient._post.retry, "wait", wait_none()):
+            self.assertEqual(self.client.list_surveys(), [{"sid": "1", "surveyls_title": "first"}])
+        self.server.fail = utils.LIMESURVEY_RETRIES
+        utils.LimeSurveyClient._session_key = None
+        with mock.patch.object(utils.LimeSurveyClient._post.retry, "wait", wait_none()):
+            with self.assertRaises(utils.LimeSurveyUnavailable):
+                self.client.list_surveys()
+
+    def test_async_client_fetches_surveys(self):
+        async def fetch():
+            client = utils.AsyncLimeSurveyClient(url=self.client.url, username="u", password="p", batching=True)
+            try:
+                return await utils.afetch_surveys(client)
+            finally:
+                await client.close()
+
+        result = asyncio.run(fetch())
+        self.assertEqual(result, {1: ({"sid": "1", "surveyls_title": "first"}, [{"question": "question of 1"}])})
+        # Its session key is its own, the sync client still has none.
+        self.assertEqual(utils.AsyncLimeSurveyClient._session_key, "key1")
+        self.assertIsNone(utils.LimeSurveyClient._session_key)
+        self.assertFalse(hasattr(utils.AsyncLimeSurveyClient, "export_responses"))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class HotQueryIndexTests(TestCase):
+    """
+    The indexes the hot queries rely on exist in the database, whatever the
+    backend; HotQueryPlanTests checks the planner uses them on PostgreSQL.
+    """
+
+    def indexes(self, model):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        return [
+            (item["columns"], item["unique"]) for item in constraints.values() if item["index"] or item["unique"]
+        ]
+
+    def assertIndexed(self, model, columns, unique=False):
+        indexed = any(
+            found[:len(columns)] == columns and (is_unique or not unique) for found, is_unique in self.indexes(model)
+        )
+        self.assertTrue(indexed, f"no index on {model._meta.db_table} {columns}")
+
+    def test_responses_by_user(self):
+        self.assertIndexed(Response, ["user_id", "id"])
+
+    def test_answers_by_response(self):
+        self.assertIndexed(Answer, ["response_id", "question_id"], unique=True)
+
+    def test_question_by_report_and_text(self):
+        self.assertIndexed(Question, ["report_id", "text_hash"], unique=True)
+
+    def test_imported_response_by_report(self):
+        self.assertIndexed(Response, ["report_id", "external_id"], unique=True)
+
+    def test_my_reports_page_queries_do_not_grow(self):
+        user = User.objects.create(username="participant")
+        report = Report.objects.create(sid=1, name="daily", created_time=jdatetime.date.today())
+        self.client.force_login(user)
+
+        def page_queries():
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(reverse("my-reports-list"))
+            return len(context.captured_queries)
+
+        Response.objects.create(report=report, user=user, created_time=jdatetime.date.today())
+        one = page_queries()
+        Response.objects.bulk_create([
+            Response(report=report, user=user, created_time=jdatetime.date.today()) for _ in range(10)
+        ])
+        self.assertEqual(page_queries(), one)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "query plans are checked on PostgreSQL")
+@override_settings(CACHES=TEST_CACHES)
+class HotQueryPlanTests(TestCase):
+    """
+    The queries on the hot paths must be served by an index, not a scan of
+    the whole table.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        today = jdatetime.date.today()
+        cls.users = User.objects.bulk_create([User(username=f"user{i}") for i in range(50)])
+        reports = Report.objects.bulk_create([Report(sid=i, name=f"report {i}", created_time=today) for i in range(20)])
+        questions = Question.objects.bulk_create([
+            Question(report=report, question=f"question {i}", text_hash=Question.hash_text(f"question {i}"))
+            for report in reports for i in range(10)
+        ])
+        responses = Response.objects.bulk_create([
+            Response(report=reports[i % 20], user=cls.users[i % 50], created_time=today) for i in range(2000)
+        ])
+        Answer.objects.bulk_create([
+            Answer(response=response, question=question, answer="answer")
+            for response in responses
+            for question in questions[(response.report_id * 10):(response.report_id * 10) + 10]
+        ], batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def plan(self, queryset):
+        with connection.cursor() as cursor:
+            # The seeded tables are small, disabling sequential scans checks
+            # that a usable index exists instead of the planner's cost guess.
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, table):
+        plan = self.plan(queryset)
+        self.assertNotIn(f"Seq Scan on {table}", plan)
+        self.assertIn("Index", plan)
+
+    def test_responses_by_user(self):
+        user = self.users[0]
+        self.assertUsesIndex(
+            Response.objects.filter(user=user).order_by("-id")[:20], Response._meta.db_table
+        )
+
+    def test_responses_by_user_keyset(self):
+        user = self.users[0]
+        self.assertUsesIndex(
+            Response.objects.filter(user=user, id__lt=1000).order_by("-id")[:20], Response._meta.db_table
+        )
+
+    def test_answers_by_response(self):
+        response = Response.objects.first()
+        self.assertUsesIndex(Answer.objects.filter(response=response), Answer._meta.db_table)
+
+    def test_question_by_report_and_text(self):
+        self.assertUsesIndex(
+            Question.objects.filter(report_id=1, text_hash=Question.hash_text("question 1")),
+            Question._meta.db_table,
+        )
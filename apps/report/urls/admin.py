@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.urls import path
+
+from apps.report.views import admin as views
+
+urlpatterns = [
+    path(
+        "<int:sid>/export/",
+        views.aexport_report if settings.ASYNC_VIEWS else views.export_report,
+        name="report-export",
+    ),
+]
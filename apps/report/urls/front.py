@@ -1,10 +1,15 @@
+from django.conf import settings
 from django.urls import path
 
 from apps.report.views import front as views
 
 urlpatterns = [
     path("", views.report_list_view, name="report-list"),
-    path("<int:sid>/", views.report_detail_view, name="report-detail"),
+    path(
+        "<int:sid>/",
+        views.areport_detail_view if settings.ASYNC_VIEWS else views.report_detail_view,
+        name="report-detail",
+    ),
     path("my-reports-list/", views.my_reports_list, name="my-reports-list"),
     path("my-reports-list/<int:id>/", views.my_report_detail, name="my-report-detail"),
     path("delete-response/", views.delete_response, name="delete-response"),
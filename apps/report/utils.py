@@ -1,90 +1,627 @@
+import asyncio
+import base64
+import codecs
+import csv
+import datetime
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
 import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
-from apps.report.models import Question, Report
+from apps.report import catalog, stats
+from apps.report.models import Answer, Question, Report, Response
 import jdatetime
 
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
 
 
 
 LIMESURVEY_PASSWORD = settings.LIMESURVEY_PASSWORD
 LIMESURVEY_USERNAME = settings.LIMESURVEY_USERNAME
 LIMESURVEY_URL = settings.LIMESURVEY_URL
+LIMESURVEY_SYNC_WORKERS = settings.LIMESURVEY_SYNC_WORKERS
+LIMESURVEY_TIMEOUT = settings.LIMESURVEY_TIMEOUT
+LIMESURVEY_RETRIES = settings.LIMESURVEY_RETRIES
+LIMESURVEY_SESSION_TTL = settings.LIMESURVEY_SESSION_TTL
+LIMESURVEY_BATCHING = settings.LIMESURVEY_BATCHING
+LIMESURVEY_BATCH_SIZE = settings.LIMESURVEY_BATCH_SIZE
+LIMESURVEY_ASYNC = settings.LIMESURVEY_ASYNC
+LIMESURVEY_IMPORT_BATCH_SIZE = settings.LIMESURVEY_IMPORT_BATCH_SIZE
+LIMESURVEY_PENDING_MAX_AGE = settings.LIMESURVEY_PENDING_MAX_AGE
+QUESTION_MAP_TIMEOUT = settings.QUESTION_MAP_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+
+class LimeSurveyError(Exception):
+    pass
+
+
+class LimeSurveyUnavailable(LimeSurveyError):
+    pass
+
+
+TRANSIENT_ERRORS = (
+    requests.ConnectionError, requests.Timeout, httpx.TransportError, LimeSurveyUnavailable
+)
+INVALID_SESSION = ("Invalid session key",)
+
+limesurvey_retry = retry(
+    retry=retry_if_exception_type(TRANSIENT_ERRORS),
+    stop=stop_after_attempt(LIMESURVEY_RETRIES),
+    wait=wait_exponential(multiplier=0.5, max=10),
+    reraise=True,
+)
+
+
+class BaseLimeSurveyClient:
+    """
+    Settings, session key and JSON-RPC payloads of the LimeSurvey
+    RemoteControl API, shared by :class:`LimeSurveyClient` and
+    :class:`AsyncLimeSurveyClient`. It does no I/O.
+
+    Each subclass keeps its own session key for the lifetime of the process,
+    renewed when it expires or LimeSurvey rejects it.
+    """
+
+    _session_key = None
+    _session_expiry = 0
+
+    def __init__(self, url=LIMESURVEY_URL, username=LIMESURVEY_USERNAME, password=LIMESURVEY_PASSWORD,
+                 batching=LIMESURVEY_BATCHING):
+        self.url = url
+        self.username = username
+        self.password = password
+        self.batching = batching
+
+    @staticmethod
+    def _check_status(status_code, text):
+        if status_code >= 500:
+            raise LimeSurveyUnavailable(text)
+        if status_code != 200:
+            raise LimeSurveyError(text)
+
+    def _session_valid(self):
+        cls = type(self)
+        return cls._session_key is not None and cls._session_expiry >= time.monotonic()
+
+    def _login_payload(self):
+        return {"method": "get_session_key", "params": [self.username, self.password], "id": 1}
+
+    def _store_session_key(self, data):
+        key = data.get("result")
+        if not isinstance(key, str):
+            raise LimeSurveyError(f"error in session key: {key}")
+        cls = type(self)
+        cls._session_key = key
+        cls._session_expiry = time.monotonic() + LIMESURVEY_SESSION_TTL
+        return key
+
+    def _forget_session(self, session_key):
+        cls = type(self)
+        if cls._session_key == session_key:
+            cls._session_key = None
+
+    @staticmethod
+    def _is_invalid_session(result):
+        return isinstance(result, dict) and result.get("status") in INVALID_SESSION
+
+    @staticmethod
+    def _batch_payload(session_key, calls):
+        return [
+            {"method": method, "params": [session_key, *params], "id": index}
+            for index, (method, *params) in enumerate(calls)
+        ]
+
+    @staticmethod
+    def _batch_results(data, calls):
+        if not isinstance(data, list):
+            raise LimeSurveyError(f"batch requests are not supported: {data}")
+        results = [None] * len(calls)
+        for item in data:
+            results[item["id"]] = item.get("result")
+        return results
+
+    @staticmethod
+    def _as_list(result):
+        # LimeSurvey answers {"status": "No surveys found"} instead of an empty list.
+        return result if isinstance(result, list) else []
+
+
+class LimeSurveyClient(BaseLimeSurveyClient):
+    """
+    JSON-RPC client for the LimeSurvey RemoteControl API, on a pooled
+    ``requests`` session.
+    """
+
+    _session_key = None
+    _session_expiry = 0
+    _session_lock = threading.Lock()
+
+    def __init__(self, url=LIMESURVEY_URL, username=LIMESURVEY_USERNAME, password=LIMESURVEY_PASSWORD,
+                 timeout=LIMESURVEY_TIMEOUT, pool_size=LIMESURVEY_SYNC_WORKERS, batching=LIMESURVEY_BATCHING):
+        super().__init__(url, username, password, batching)
+        self.timeout = timeout
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+    @limesurvey_retry
+    def _post(self, payload):
+        response = self.http.post(self.url, json=payload, timeout=self.timeout)
+        self._check_status(response.status_code, response.text)
+        return response.json()
+
+    @property
+    def session_key(self):
+        with self._session_lock:
+            if not self._session_valid():
+                self._store_session_key(self._post(self._login_payload()))
+            return type(self)._session_key
+
+    def invalidate_session(self, session_key):
+        with self._session_lock:
+            self._forget_session(session_key)
+
+    def call(self, method, *params):
+        for _ in range(2):
+            session_key = self.session_key
+            data = self._post({"method": method, "params": [session_key, *params], "id": 1})
+            result = data.get("result")
+            if not self._is_invalid_session(result):
+                return result
+            self.invalidate_session(session_key)
+        raise LimeSurveyError(f"{method}: {result}")
+
+    def batch(self, calls):
+        """
+        Run ``[(method, *params), ...]`` and return the results in order, in
+        a single JSON-RPC batch request when batching is enabled.
+        """
+        if not self.batching or len(calls) < 2:
+            return [self.call(*item) for item in calls]
+        session_key = self.session_key
+        results = self._batch_results(self._post(self._batch_payload(session_key, calls)), calls)
+        if any(self._is_invalid_session(result) for result in results):
+            self.invalidate_session(session_key)
+            return [self.call(*item) for item in calls]
+        return results
+
+    def release(self):
+        cls = type(self)
+        with cls._session_lock:
+            if cls._session_key is not None:
+                self._post({"method": "release_session_key", "params": [cls._session_key], "id": 1})
+                cls._session_key = None
+
+    def close(self):
+        self.http.close()
+
+    def list_surveys(self):
+        return self._as_list(self.call("list_surveys", self.username))
+
+    def list_questions(self, survey_id):
+        return self._as_list(self.call("list_questions", survey_id))
+
+    def export_responses(self, survey_id, from_id=None, to_id=None):
+        """
+        Return the responses of a survey with an id from ``from_id`` to
+        ``to_id``, complete or not, as base64 encoded CSV headed by the
+        question codes, or None when there are none.
+        """
+        result = self.call(
+            "export_responses", survey_id, "csv", None, "all", "code", "short", from_id, to_id
+        )
+        # LimeSurvey answers {"status": "No Data, ..."} when nothing matches.
+        return result if isinstance(result, str) else None
+
+
+class AsyncLimeSurveyClient(BaseLimeSurveyClient):
+    """
+    asyncio client on top of ``httpx``, used to fetch the questions of all
+    surveys concurrently from a single thread.
+    """
+
+    _session_key = None
+    _session_expiry = 0
+
+    def __init__(self, url=LIMESURVEY_URL, username=LIMESURVEY_USERNAME, password=LIMESURVEY_PASSWORD,
+                 timeout=LIMESURVEY_TIMEOUT, pool_size=LIMESURVEY_SYNC_WORKERS, batching=LIMESURVEY_BATCHING):
+        super().__init__(url, username, password, batching)
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        # Bound to the running loop on first use.
+        self._lock = None
+
+    @property
+    def session_lock(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @limesurvey_retry
+    async def _post(self, payload):
+        response = await self.http.post(self.url, json=payload)
+        self._check_status(response.status_code, response.text)
+        return response.json()
+
+    async def get_session_key(self):
+        async with self.session_lock:
+            if not self._session_valid():
+                self._store_session_key(await self._post(self._login_payload()))
+            return type(self)._session_key
+
+    def invalidate_session(self, session_key):
+        self._forget_session(session_key)
+
+    async def call(self, method, *params):
+        for _ in range(2):
+            session_key = await self.get_session_key()
+            data = await self._post({"method": method, "params": [session_key, *params], "id": 1})
+            result = data.get("result")
+            if not self._is_invalid_session(result):
+                return result
+            self.invalidate_session(session_key)
+        raise LimeSurveyError(f"{method}: {result}")
+
+    async def batch(self, calls):
+        if not self.batching or len(calls) < 2:
+            return [await self.call(*item) for item in calls]
+        session_key = await self.get_session_key()
+        results = self._batch_results(await self._post(self._batch_payload(session_key, calls)), calls)
+        if any(self._is_invalid_session(result) for result in results):
+            self.invalidate_session(session_key)
+            return [await self.call(*item) for item in calls]
+        return results
 
+    async def release(self):
+        cls = type(self)
+        if cls._session_key is not None:
+            await self._post({"method": "release_session_key", "params": [cls._session_key], "id": 1})
+            cls._session_key = None
 
+    async def close(self):
+        await self.http.aclose()
 
-def release_session_key(session_key):
-    payload = {"method": "release_session_key", "params": [session_key], "id": 1}
-    response = requests.post(LIMESURVEY_URL, json=payload)
-    return response.status_code == 200
+    async def list_surveys(self):
+        return self._as_list(await self.call("list_surveys", self.username))
 
+    async def list_questions(self, survey_id):
+        return self._as_list(await self.call("list_questions", survey_id))
 
-def get_list_surveys(session_key):
-    payload = {"method": "list_surveys", "params": [session_key, LIMESURVEY_USERNAME], "id": 1}
-    response = requests.post(LIMESURVEY_URL, json=payload)
-    if response.status_code == 200:
-        return response.json().get("result", [])
-    raise Exception(f"خطا در دریافت لیست پرسشنامه‌ها: {response.text}")
 
+_client = None
 
-def list_questions(session_key, survey_id):
-    payload = {
-        "method": "list_questions",
-        "params": [session_key, survey_id],
-        "id": 1
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = LimeSurveyClient()
+    return _client
+
+
+def fetch_surveys(client, progress=None):
+    surveys = client.list_surveys()
+    if progress is not None:
+        progress(0, len(surveys))
+    size = LIMESURVEY_BATCH_SIZE if client.batching else 1
+    chunks = [surveys[i:i + size] for i in range(0, len(surveys), size)]
+    result = {}
+    done = 0
+    with ThreadPoolExecutor(max_workers=LIMESURVEY_SYNC_WORKERS) as executor:
+        questions = executor.map(
+            lambda chunk: client.batch([("list_questions", survey["sid"]) for survey in chunk]), chunks
+        )
+        for chunk, items in zip(chunks, questions):
+            for survey, survey_questions in zip(chunk, items):
+                result[int(survey["sid"])] = (
+                    survey, survey_questions if isinstance(survey_questions, list) else []
+                )
+            done += len(chunk)
+            if progress is not None:
+                progress(done)
+    return result
+
+
+async def afetch_surveys(client, progress=None):
+    """
+    Same as :func:`fetch_surveys` with an :class:`AsyncLimeSurveyClient`,
+    running at most ``LIMESURVEY_SYNC_WORKERS`` requests at a time.
+    """
+    if progress is not None:
+        progress = sync_to_async(progress)
+    surveys = await client.list_surveys()
+    if progress is not None:
+        await progress(0, len(surveys))
+    size = LIMESURVEY_BATCH_SIZE if client.batching else 1
+    chunks = [surveys[i:i + size] for i in range(0, len(surveys), size)]
+    slots = asyncio.Semaphore(LIMESURVEY_SYNC_WORKERS)
+    result = {}
+    done = 0
+
+    async def fetch(chunk):
+        nonlocal done
+        async with slots:
+            items = await client.batch([("list_questions", survey["sid"]) for survey in chunk])
+        for survey, survey_questions in zip(chunk, items):
+            result[int(survey["sid"])] = (
+                survey, survey_questions if isinstance(survey_questions, list) else []
+            )
+        done += len(chunk)
+        if progress is not None:
+            await progress(done)
+
+    await asyncio.gather(*(fetch(chunk) for chunk in chunks))
+    # Keep the LimeSurvey order, as fetch_surveys does.
+    return {int(survey["sid"]): result[int(survey["sid"])] for survey in surveys}
+
+
+async def afetch_all(progress=None):
+    client = AsyncLimeSurveyClient()
+    try:
+        return await afetch_surveys(client, progress)
+    finally:
+        await client.close()
+
+
+@transaction.atomic
+def sync_surveys(surveys):
+    """
+    Apply the fetched ``{sid: (survey, questions)}`` map to the database,
+    creating or renaming reports and adding questions that are not stored yet.
+    """
+    time = jdatetime.date.today()
+    reports = Report.objects.in_bulk(list(surveys))
+    new_reports, changed_reports = [], []
+    for sid, (survey, _) in surveys.items():
+        name = survey["surveyls_title"]
+        report = reports.get(sid)
+        if report is None:
+            new_reports.append(Report(sid=sid, name=name, created_time=time))
+        elif report.name != name:
+            report.name = name
+            changed_reports.append(report)
+    Report.objects.bulk_create(new_reports)
+    Report.objects.bulk_update(changed_reports, ["name"])
+
+    existing = set(
+        Question.objects.filter(report_id__in=list(surveys)).values_list("report_id", "text_hash")
+    )
+    new_questions = []
+    for sid, (_, questions) in surveys.items():
+        for item in questions:
+            text_hash = Question.hash_text(item["question"])
+            if (sid, text_hash) not in existing:
+                existing.add((sid, text_hash))
+                new_questions.append(Question(report_id=sid, question=item["question"], text_hash=text_hash))
+    Question.objects.bulk_create(new_questions, batch_size=500)
+
+    changed = {report.sid for report in changed_reports}
+    changed.update(question.report_id for question in new_questions)
+    if new_reports or changed:
+        transaction.on_commit(catalog.invalidate)
+    # New questions change the fill rate of their reports.
+    transaction.on_commit(lambda: stats.rollup(changed))
+
+    return {
+        "reports_created": len(new_reports),
+        "reports_updated": len(changed_reports),
+        "questions_created": len(new_questions),
     }
-    response = requests.post(LIMESURVEY_URL, json=payload)
-    if response.status_code == 200:
-        return response.json().get("result", [])
-    raise Exception(f"خطا در دریافت لیست سوالات: {response.text}")
 
 
-def save_report(name, sid, description=""):
+def question_map_key(sid):
+    return f"catalog:{catalog.get_version()}:report:{sid}:questions"
+
+
+def get_question_map(sid):
+    """
+    Return ``{text_hash: question_id}`` for the questions of a report.
+
+    The map lives in the shared catalog cache under the catalog version: the
+    sync that replaces it runs in the job worker, not in the web processes
+    that read it, and readers of the previous version keep their map.
+    """
+    key = question_map_key(sid)
+    mapping = catalog.catalog_cache.get(key)
+    if mapping is None:
+        mapping = dict(Question.objects.filter(report_id=sid).values_list("text_hash", "id"))
+        catalog.catalog_cache.set(key, mapping, QUESTION_MAP_TIMEOUT)
+    return mapping
+
+
+def find_question(mapping, text):
+    return mapping.get(Question.hash_text(text))
+
+
+def decode_lines(encoded, chunk_size=64 * 1024):
+    """
+    Yield the lines of a base64 encoded UTF-8 document, decoding
+    ``chunk_size`` characters at a time instead of the whole export.
+    """
+    chunk_size -= chunk_size % 4
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    rest = ""
+    for start in range(0, len(encoded), chunk_size):
+        text = rest + decoder.decode(base64.b64decode(encoded[start:start + chunk_size]))
+        lines = text.splitlines(keepends=True)
+        rest = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+        yield from lines
+    rest += decoder.decode(b"", final=True)
+    if rest:
+        yield rest
+
+
+def iter_responses(encoded):
+    # csv joins the lines of quoted multi-line answers itself.
+    return csv.DictReader(decode_lines(encoded))
+
+
+def submit_date(value):
     try:
-        Report.objects.get(sid=sid)
-    except:
-        time = jdatetime.date.today()
-        instance = Report.objects.create(
-            name=name, sid=sid, description=description, created_time=time
-        )
-        instance.save()
-        return instance
-    else:
-        return None
+        date = datetime.datetime.strptime(value[:10], "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return jdatetime.date.today()
+    return jdatetime.date.fromgregorian(date=date)
+
 
+def question_columns(client, report):
+    """
+    Return ``{question code: question id}`` for the top level questions of
+    a report; subquestion columns (``code[sub]``) are not imported.
+    """
+    mapping = get_question_map(report.sid)
+    columns = {}
+    for item in client.list_questions(report.sid):
+        if str(item.get("parent_qid", "0")) != "0":
+            continue
+        question_id = find_question(mapping, item["question"])
+        if question_id is not None:
+            columns[item["title"]] = question_id
+    return columns
 
-def save_question(report, question):
-    instance = Question.objects.create(
-        report=report, question=question
+
+@transaction.atomic
+def save_responses(report, rows, columns, mark, pending):
+    """
+    Store a batch of exported rows as Responses and Answers, then move the
+    report's high-water mark to ``mark`` and keep the ``pending`` responses.
+    Rows imported before are skipped.
+    """
+    existing = set(Response.objects.filter(
+        report=report, external_id__in=[int(row["id"]) for row in rows]
+    ).values_list("external_id", flat=True))
+    rows = [row for row in rows if int(row["id"]) not in existing]
+    tokens = {row.get("token") for row in rows if row.get("token")}
+    users = dict(User.objects.filter(username__in=tokens).values_list("username", "id"))
+    responses, answers = [], []
+    for row in rows:
+        # Codes whose texts hash the same are one question, the last one wins.
+        values = {question_id: row[code] for code, question_id in columns.items() if row.get(code)}
+        responses.append(Response(
+            report=report,
+            user_id=users.get(row.get("token")),
+            created_time=submit_date(row.get("submitdate")),
+            external_id=int(row["id"]),
+            answer_count=len(values),
+            summary=Response.summarize(values.values()),
+        ))
+        answers.append(values)
+    Response.objects.bulk_create(responses)
+    Answer.objects.bulk_create(
+        [
+            Answer(response=response, question_id=question_id, answer=answer)
+            for response, values in zip(responses, answers)
+            for question_id, answer in values.items()
+        ],
+        batch_size=1000,
     )
-    instance.save()
-    return instance
-    
-
-def get_session_key():
-    payload = {"method": "get_session_key", "params": [LIMESURVEY_USERNAME, LIMESURVEY_PASSWORD], "id": 1}  
-    response = requests.post(LIMESURVEY_URL, json=payload)
-    if response.status_code == 200:
-        return response.json().get("result")
-    raise Exception(response.text)
-
-
-def main():
-    survey_dict = {}
-    session_key = get_session_key()
-    if session_key is not None:
-        survey_list = get_list_surveys(session_key)
-        for i in survey_list:
-            survey_dict.update(i)
-            report_instance = save_report(
-                name=i["surveyls_title"], sid=i["sid"]
-                )
-            if report_instance is not None:
-                questions = list_questions(session_key, survey_dict["sid"])
-                for i in questions:
-                    save_question(
-                        report=report_instance, question=i["question"]
-                        )
+    set_mark(report, mark, pending)
+    return len(responses)
+
+
+def set_mark(report, mark, pending):
+    mark = max(mark, report.last_response_id)
+    pending = {str(response_id): seen for response_id, seen in sorted(pending.items())}
+    if (mark, pending) != (report.last_response_id, report.pending_responses):
+        report.last_response_id, report.pending_responses = mark, pending
+        report.save(update_fields=["last_response_id", "pending_responses"])
+
+
+def import_responses(client, report):
+    """
+    Import the completed LimeSurvey responses of ``report`` newer than its
+    high-water mark, ``LIMESURVEY_IMPORT_BATCH_SIZE`` at a time.
+
+    The mark moves past responses still in progress. Their ids are kept in
+    ``pending_responses`` and only they are exported again, until they are
+    submitted or are older than ``LIMESURVEY_PENDING_MAX_AGE`` and taken as
+    abandoned.
+    """
+    now = int(time.time())
+    pending = {
+        int(response_id): seen for response_id, seen in report.pending_responses.items()
+        if seen > now - LIMESURVEY_PENDING_MAX_AGE
+    }
+    exports = [client.export_responses(report.sid, report.last_response_id + 1)]
+    if pending:
+        exports.append(client.export_responses(report.sid, min(pending), max(pending)))
+    exports = [encoded for encoded in exports if encoded]
+    columns = question_columns(client, report) if exports else {}
+    start = report.last_response_id
+    rechecked = set(pending)
+    mark = start
+
+    def completed():
+        nonlocal mark
+        for encoded in exports:
+            for row in iter_responses(encoded):
+                response_id = int(row["id"])
+                if response_id <= start and response_id not in rechecked:
+                    continue
+                mark = max(mark, response_id)
+                if not row.get("submitdate"):
+                    pending.setdefault(response_id, now)
+                    continue
+                pending.pop(response_id, None)
+                yield row
+
+    rows = completed()
+    imported = 0
+    while batch := list(itertools.islice(rows, LIMESURVEY_IMPORT_BATCH_SIZE)):
+        imported += save_responses(report, batch, columns, mark, pending)
+    # Responses in progress after the last completed one, and expired ones.
+    set_mark(report, mark, pending)
+    return imported
+
+
+def import_all(progress=None):
+    client = get_client()
+    reports = list(Report.objects.order_by("sid"))
+    if progress is not None:
+        progress(0, len(reports))
+    imported, failed = {}, []
+    for done, report in enumerate(reports, 1):
+        # One broken survey must not hold back the others.
+        try:
+            count = import_responses(client, report)
+        except Exception:
+            logger.exception("import of the responses of report %s failed", report.sid)
+            failed.append(report.sid)
+        else:
+            if count:
+                imported[report.sid] = count
+        if progress is not None:
+            progress(done)
+    stats.rollup(imported)
+    return {"responses_imported": sum(imported.values()), "reports": len(imported), "failed": failed}
+
+
+def import_job(job):
+    return import_all(progress=job.set_progress)
+
+
+def main(progress=None):
+    if LIMESURVEY_ASYNC:
+        surveys = asyncio.run(afetch_all(progress))
     else:
-        raise Exception("error in session key")
-    return release_session_key(session_key)
\ No newline at end of file
+        surveys = fetch_surveys(get_client(), progress)
+    return sync_surveys(surveys)
+
+
+def sync_job(job):
+    return main(progress=job.set_progress)
@@ -0,0 +1,67 @@
+import tempfile
+
+from asgiref.sync import sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, StreamingHttpResponse
+
+from apps.account.decorators import async_staff_member_required
+from apps.report.export import (
+    CONTENT_TYPES, FORMATS, aiter_sync, export_filename, iter_csv, iter_file, write_parquet
+)
+from apps.report.models import Report
+
+
+def get_format(request):
+    format = request.GET.get("format", "csv")
+    if format not in FORMATS:
+        raise Http404
+    return format
+
+
+def build_parquet(report):
+    # Parquet writes its footer last, so the file is built on disk first.
+    file = tempfile.TemporaryFile()
+    write_parquet(report, file)
+    size = file.tell()
+    file.seek(0)
+    return file, size
+
+
+def attachment(response, filename):
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@staff_member_required
+def export_report(request, sid):
+    try:
+        report = Report.objects.get(sid=sid)
+    except Report.DoesNotExist:
+        raise Http404
+    format = get_format(request)
+    filename = export_filename(report, format)
+    if format == "csv":
+        return attachment(StreamingHttpResponse(iter_csv(report), content_type=CONTENT_TYPES[format]), filename)
+    file, _ = build_parquet(report)
+    return FileResponse(file, as_attachment=True, filename=filename, content_type=CONTENT_TYPES[format])
+
+
+@async_staff_member_required
+async def aexport_report(request, sid):
+    """
+    :func:`export_report` for the ASGI deployment, streaming the export
+    from an async iterator.
+    """
+    try:
+        report = await Report.objects.aget(sid=sid)
+    except Report.DoesNotExist:
+        raise Http404
+    format = get_format(request)
+    filename = export_filename(report, format)
+    if format == "csv":
+        response = StreamingHttpResponse(aiter_sync(iter_csv(report)), content_type=CONTENT_TYPES[format])
+        return attachment(response, filename)
+    file, size = await sync_to_async(build_parquet)(report)
+    response = StreamingHttpResponse(aiter_sync(iter_file(file)), content_type=CONTENT_TYPES[format])
+    response["Content-Length"] = str(size)
+    return attachment(response, filename)
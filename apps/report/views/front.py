@@ -1,49 +1,114 @@
 import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.views.decorators.http import require_POST
 from django.shortcuts import redirect, render
 from django.contrib.auth.decorators import login_required
 
-from apps.report.models import Answer, Question, Report, Response
+from apps.account.decorators import async_login_required
+from apps.report import catalog
+from apps.report.models import Answer, Response
 from apps.voice_process.utils import RegisterAnswer
 
+MY_REPORTS_PAGE_SIZE = settings.MY_REPORTS_PAGE_SIZE
+
+
+def catalog_validators(request, *parts):
+    """
+    Return the ``(etag, last_modified)`` of a page built from the catalog.
+    """
+    etag = quote_etag("-".join(
+        str(part) for part in (catalog.build_id(), catalog.get_version(), request.user.id, *parts)
+    ))
+    return etag, catalog.last_modified()
+
+
+def conditional_response(request, etag, last_modified, render_page):
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render_page()
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # The pages are per user, browsers revalidate them on every view.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 @login_required
 def report_list_view(request):
-    reports = Report.objects.all()
-    return render(request, "report/report_front_list.html", {"reports": reports})
+    etag, last_modified = catalog_validators(request)
+    return conditional_response(request, etag, last_modified, lambda: render(
+        request, "report/report_front_list.html", {"reports": catalog.get_reports()}
+    ))
 
 
 @login_required
 def report_detail_view(request, sid):
-    try:
-        report = Report.objects.get(sid=sid)
-    except Report.DoesNotExist:
+    entry = catalog.get_report(sid)
+    if entry is None:
         raise Http404
-    
-    questions = Question.objects.filter(report=report)
+    report, questions = entry
+
     if request.method == "GET":
-        return render(request, "report/report_detail.html", {"report": report, "questions": questions})
+        etag, last_modified = catalog_validators(request, sid)
+        return conditional_response(request, etag, last_modified, lambda: render(
+            request, "report/report_detail.html", {"report": report, "questions": questions}
+        ))
     else:
         data = json.loads(request.body)
         result = RegisterAnswer.handler(data, request.user)
         return JsonResponse({"status": True})
-        
+
+
+@async_login_required
+async def areport_detail_view(request, sid):
+    entry = await sync_to_async(catalog.get_report)(sid)
+    if entry is None:
+        raise Http404
+    report, questions = entry
+
+    if request.method == "GET":
+        etag, last_modified = await sync_to_async(catalog_validators)(request, sid)
+        return await sync_to_async(conditional_response)(request, etag, last_modified, lambda: render(
+            request, "report/report_detail.html", {"report": report, "questions": questions}
+        ))
+    else:
+        data = json.loads(request.body)
+        await sync_to_async(RegisterAnswer.handler)(data, request.user)
+        return JsonResponse({"status": True})
+
 
 @login_required
 def my_reports_list(request):
-    responses = Response.objects.filter(user=request.user).order_by("-id")
-    return render(request, "report/my_reports_list.html", {"responses": responses})
+    # Keyset pagination: ?before=<id> continues after the last response shown.
+    responses = Response.objects.filter(user=request.user).select_related("report").only(
+        "id", "created_time", "answer_count", "summary", "report__name"
+    ).order_by("-id")
+    before = request.GET.get("before")
+    if before and before.isdigit():
+        responses = responses.filter(id__lt=int(before))
+    responses = list(responses[:MY_REPORTS_PAGE_SIZE + 1])
+    next_before = responses[MY_REPORTS_PAGE_SIZE - 1].id if len(responses) > MY_REPORTS_PAGE_SIZE else None
+    return render(request, "report/my_reports_list.html", {
+        "responses": responses[:MY_REPORTS_PAGE_SIZE], "next_before": next_before,
+    })
 
 
 @login_required
 def my_report_detail(request, id):
     try:
-        response = Response.objects.get(id=id)
-    except:
-        return Http404
+        response = Response.objects.select_related("report").get(id=id, user=request.user)
+    except Response.DoesNotExist:
+        raise Http404
     else:
-        responses = Answer.objects.filter(response=response)
-        return render(request, "report/my_report_detail.html", {"responses": responses, "id": response})
+        responses = Answer.objects.filter(response=response).select_related("question").order_by("id")
+        voices = response.voice_response.only("id").order_by("id")
+        return render(request, "report/my_report_detail.html", {
+            "responses": responses, "id": response, "voices": voices,
+        })
 
 
 @require_POST
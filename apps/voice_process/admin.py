@@ -1,9 +1,31 @@
 from django.contrib import admin
 from django.contrib.admin import register
+from django.urls import reverse
+from django.utils.html import format_html
 
-from apps.voice_process.models import Voice
+from apps.voice_process.models import CacheStat, Voice, VoiceQuota
 
 
 @register(Voice)
 class VoiceAdmin(admin.ModelAdmin):
-    list_display = ("response", "audio_file")
+    list_display = ("id", "user", "report", "response", "audio", "created_time")
+    list_select_related = ("user", "report", "response__user")
+
+    @admin.display(description="audio")
+    def audio(self, obj):
+        if not obj.audio_file:
+            return "-"
+        return format_html(
+            '<audio controls preload="none" src="{}"></audio>', reverse("voice-audio", args=[obj.id])
+        )
+
+
+@register(VoiceQuota)
+class VoiceQuotaAdmin(admin.ModelAdmin):
+    list_display = ("user", "used")
+    list_select_related = ("user",)
+
+
+@register(CacheStat)
+class CacheStatAdmin(admin.ModelAdmin):
+    list_display = ("kind", "hit", "miss")
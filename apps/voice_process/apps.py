@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class VoiceProcessConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.voice_process'
+
+    def ready(self):
+        from apps.voice_process import signals  # noqa: F401
@@ -0,0 +1,90 @@
+import logging
+import tempfile
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+VOICE_AUDIO_FORMAT = settings.VOICE_AUDIO_FORMAT
+VOICE_AUDIO_CODEC = settings.VOICE_AUDIO_CODEC
+VOICE_AUDIO_BITRATE = settings.VOICE_AUDIO_BITRATE
+VOICE_SAMPLE_RATE = settings.VOICE_SAMPLE_RATE
+VOICE_SILENCE_THRESHOLD = settings.VOICE_SILENCE_THRESHOLD
+VOICE_CHUNK_SECONDS = settings.VOICE_CHUNK_SECONDS
+VOICE_CHUNK_MIN_SECONDS = settings.VOICE_CHUNK_MIN_SECONDS
+
+
+
+def load_audio(file):
+    # pydub looks for ffmpeg when it is imported, keep it out of module load.
+    from pydub import AudioSegment
+
+    return AudioSegment.from_file(file)
+
+
+def trim_silence(audio):
+    from pydub.silence import detect_leading_silence
+
+    start = detect_leading_silence(audio, silence_threshold=VOICE_SILENCE_THRESHOLD)
+    end = len(audio) - detect_leading_silence(audio.reverse(), silence_threshold=VOICE_SILENCE_THRESHOLD)
+    if end <= start:
+        return audio
+    return audio[start:end]
+
+
+def export_audio(audio):
+    output = tempfile.TemporaryFile()
+    audio.export(output, format=VOICE_AUDIO_FORMAT, codec=VOICE_AUDIO_CODEC, bitrate=VOICE_AUDIO_BITRATE)
+    output.seek(0)
+    return output
+
+
+def normalize_audio(file):
+    """
+    Downmix to mono, resample, trim leading and trailing silence and encode
+    with the configured codec. Return a temporary file, or None when the
+    input cannot be decoded or ffmpeg is not available.
+    """
+    try:
+        audio = load_audio(file)
+        audio = audio.set_channels(1).set_frame_rate(VOICE_SAMPLE_RATE)
+        return export_audio(trim_silence(audio))
+    except Exception:
+        logger.warning("could not normalize audio %s", getattr(file, "name", ""), exc_info=True)
+        return None
+
+
+def cut_points(audio, max_ms, min_ms):
+    from pydub.silence import detect_silence
+
+    silences = detect_silence(
+        audio, min_silence_len=400, silence_thresh=VOICE_SILENCE_THRESHOLD, seek_step=10
+    )
+    pauses = [(start + end) // 2 for start, end in silences]
+    points, start = [], 0
+    while len(audio) - start > max_ms:
+        candidates = [p for p in pauses if start + min_ms <= p <= start + max_ms]
+        # Cut at the latest pause in the window, or hard at the limit when there is none.
+        cut = candidates[-1] if candidates else start + max_ms
+        points.append(cut)
+        start = cut
+    return points
+
+
+def split_audio(file):
+    """
+    Split a recording longer than VOICE_CHUNK_SECONDS on pauses into bounded
+    segments. Return the encoded segments in order, or None when the file
+    is short enough (or cannot be decoded) and should be sent whole.
+    """
+    max_ms = VOICE_CHUNK_SECONDS * 1000
+    try:
+        audio = load_audio(file)
+        if len(audio) <= max_ms:
+            return None
+        bounds = [0, *cut_points(audio, max_ms, VOICE_CHUNK_MIN_SECONDS * 1000), len(audio)]
+        return [export_audio(audio[start:end]) for start, end in zip(bounds, bounds[1:])]
+    except Exception:
+        logger.warning("could not split audio %s", getattr(file, "name", ""), exc_info=True)
+        return None
@@ -0,0 +1,60 @@
+import hashlib
+import json
+
+from django.core.cache import caches
+from django.db.models import F
+from django.utils.connection import ConnectionProxy
+
+from apps.voice_process.models import CacheStat
+
+
+# Resolved on use, so override_settings(CACHES=...) applies.
+voice_cache = ConnectionProxy(caches, "voice")
+
+
+
+def file_digest(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def count(kind, hit):
+    field = "hit" if hit else "miss"
+    counter = CacheStat.objects.filter(kind=kind)
+    if not counter.update(**{field: F(field) + 1}):
+        CacheStat.objects.get_or_create(kind=kind)
+        counter.update(**{field: F(field) + 1})
+
+
+def lookup(kind, key, count_miss=True):
+    value = voice_cache.get(f"{kind}:{key}")
+    if value is not None or count_miss:
+        count(kind, value is not None)
+    return value
+
+
+def store(kind, key, value):
+    voice_cache.set(f"{kind}:{key}", value)
+
+
+def get_transcript(audio_hash, count_miss=True):
+    return lookup("transcript", audio_hash, count_miss)
+
+
+def set_transcript(audio_hash, text):
+    store("transcript", audio_hash, text)
+
+
+def extraction_key(text, questions, model_name):
+    data = json.dumps([text, questions, model_name], ensure_ascii=False)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def get_extraction(key, count_miss=True):
+    return lookup("extraction", key, count_miss)
+
+
+def set_extraction(key, answers):
+    store("extraction", key, answers)
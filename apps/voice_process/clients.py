@@ -0,0 +1,137 @@
+import asyncio
+import atexit
+import threading
+
+import httpx
+
+from django.conf import settings
+
+# openai and langchain_openai are imported by the getters below on first
+# use: together they take over a second to import, which web workers that
+# never call the provider should not pay at boot.
+
+
+AVALAI_BASE_URL = settings.AVALAI_BASE_URL
+AVALAI_API_KEY = settings.AVALAI_API_KEY
+AVALAI_HTTP2 = settings.AVALAI_HTTP2
+AVALAI_TIMEOUT = settings.AVALAI_TIMEOUT
+AVALAI_CONNECT_TIMEOUT = settings.AVALAI_CONNECT_TIMEOUT
+AVALAI_MAX_CONNECTIONS = settings.AVALAI_MAX_CONNECTIONS
+AVALAI_MAX_RETRIES = settings.AVALAI_MAX_RETRIES
+AVALAI_MAX_CONCURRENCY = settings.AVALAI_MAX_CONCURRENCY
+
+CHAT_MODEL = "gpt-4o-mini"
+
+_lock = threading.RLock()
+_clients = {}
+
+# Caps the number of requests in flight to the provider from this process.
+provider_slot = threading.BoundedSemaphore(AVALAI_MAX_CONCURRENCY)
+
+
+def _get(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def http_options():
+    return {
+        "http2": AVALAI_HTTP2,
+        "timeout": httpx.Timeout(AVALAI_TIMEOUT, connect=AVALAI_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=AVALAI_MAX_CONNECTIONS,
+            max_keepalive_connections=AVALAI_MAX_CONNECTIONS,
+            keepalive_expiry=60,
+        ),
+    }
+
+
+def get_http_client():
+    return _get("http", lambda: httpx.Client(**http_options()))
+
+
+def get_async_http_client():
+    # Used from the ASGI event loop only, the worker process stays synchronous.
+    return _get("async_http", lambda: httpx.AsyncClient(**http_options()))
+
+
+def get_async_provider_slot():
+    return _get("async_slot", lambda: asyncio.Semaphore(AVALAI_MAX_CONCURRENCY))
+
+
+def get_openai_client():
+    from openai import OpenAI
+
+    return _get("openai", lambda: OpenAI(
+        base_url=AVALAI_BASE_URL,
+        api_key=AVALAI_API_KEY,
+        http_client=get_http_client(),
+        max_retries=AVALAI_MAX_RETRIES,
+    ))
+
+
+def get_async_openai_client():
+    from openai import AsyncOpenAI
+
+    return _get("async_openai", lambda: AsyncOpenAI(
+        base_url=AVALAI_BASE_URL,
+        api_key=AVALAI_API_KEY,
+        http_client=get_async_http_client(),
+        max_retries=AVALAI_MAX_RETRIES,
+    ))
+
+
+def get_chat_model(model_name=CHAT_MODEL):
+    from langchain_openai import ChatOpenAI
+
+    return _get(f"chat:{model_name}", lambda: ChatOpenAI(
+        model=model_name,
+        base_url=AVALAI_BASE_URL,
+        api_key=AVALAI_API_KEY,
+        http_client=get_http_client(),
+        max_retries=AVALAI_MAX_RETRIES,
+    ))
+
+
+def get_async_chat_model(model_name=CHAT_MODEL):
+    # A separate instance, so that processes that only call the model
+    # synchronously (the job worker) never open an async pool.
+    from langchain_openai import ChatOpenAI
+
+    return _get(f"async_chat:{model_name}", lambda: ChatOpenAI(
+        model=model_name,
+        base_url=AVALAI_BASE_URL,
+        api_key=AVALAI_API_KEY,
+        http_async_client=get_async_http_client(),
+        max_retries=AVALAI_MAX_RETRIES,
+    ))
+
+
+def reset_clients():
+    """
+    Forget the clients without closing them, for a forked worker that must
+    not share the parent's sockets.
+    """
+    with _lock:
+        _clients.clear()
+
+
+def close_clients():
+    """
+    Close the synchronous pool. The async pool belongs to the event loop of
+    the ASGI server, which is gone by the time the worker exits; its
+    sockets are released with the process.
+    """
+    with _lock:
+        http_client = _clients.get("http")
+        _clients.clear()
+    if http_client is not None:
+        http_client.close()
+
+
+atexit.register(close_clients)
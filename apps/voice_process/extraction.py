@@ -0,0 +1,94 @@
+import functools
+import re
+
+import orjson
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, create_model
+
+
+class ExtractedAnswers(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True, populate_by_name=True, extra="ignore")
+
+
+@functools.lru_cache(maxsize=256)
+def answer_model(question_ids):
+    """
+    Pydantic model of one extraction call: one optional string field per
+    question, keyed by the question id as it appears in the prompt.
+    """
+    fields = {
+        f"q{question_id}": (str | None, Field(default=None, alias=str(question_id)))
+        for question_id in question_ids
+    }
+    return create_model("ExtractedAnswers", __base__=ExtractedAnswers, **fields)
+
+
+FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+
+
+def repair_json(content):
+    """
+    Best effort cleanup of a model reply: drop code fences and surrounding
+    text, and close a truncated object.
+    """
+    content = FENCE.sub("", content.strip())
+    start = content.find("{")
+    if start == -1:
+        return "{}"
+    content = content[start:]
+    end = content.rfind("}")
+    if end != -1:
+        try:
+            orjson.loads(content[:end + 1])
+            return content[:end + 1]
+        except orjson.JSONDecodeError:
+            pass
+    # Truncated reply: cut after the last complete "key": "value" pair.
+    last = content.rfind('",')
+    if last == -1:
+        return "{}"
+    return content[:last + 1] + "}"
+
+
+PAIR = re.compile(r'"(\d+)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def completed_pairs(content):
+    """
+    Yield ``(question_id, answer)`` for every string value that is already
+    complete in a partially streamed JSON reply.
+    """
+    for match in PAIR.finditer(content):
+        try:
+            answer = orjson.loads(f'"{match.group(2)}"')
+        except orjson.JSONDecodeError:
+            continue
+        yield int(match.group(1)), answer
+
+
+def load_json(content):
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        return orjson.loads(repair_json(content))
+
+
+def parse_answers(content, question_ids):
+    """
+    Parse and validate a reply into ``{question_id: answer}``. Unknown keys
+    and invalid values are dropped; raise ValueError when the repaired reply
+    is still not a JSON object.
+    """
+    data = load_json(content)
+    if not isinstance(data, dict):
+        raise ValueError("extraction reply is not an object")
+    model = answer_model(tuple(question_ids))
+    try:
+        answers = model.model_validate(data)
+    except ValidationError as error:
+        invalid = {str(item["loc"][0]) for item in error.errors()}
+        answers = model.model_validate({key: value for key, value in data.items() if key not in invalid})
+    return {
+        question_id: value
+        for question_id in question_ids
+        if (value := getattr(answers, f"q{question_id}"))
+    }
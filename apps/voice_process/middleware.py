@@ -0,0 +1,49 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.decorators import sync_and_async_middleware
+
+from apps.voice_process.quota import has_quota
+
+
+VOICE_UPLOAD_MAX_SIZE = settings.VOICE_UPLOAD_MAX_SIZE
+
+
+def is_upload(request):
+    return request.method == "POST" and request.path == reverse("speech-to-text")
+
+
+def check_upload(request):
+    """
+    Return an error response for a voice upload that must not be read.
+    """
+    if int(request.META.get("CONTENT_LENGTH") or 0) > VOICE_UPLOAD_MAX_SIZE:
+        return JsonResponse({"error": "file too large"}, status=413)
+    # Only a fast path, save_voice reserves the quota atomically.
+    if request.user.is_authenticated and not has_quota(request.user):
+        return JsonResponse({"error": "voice quota exceeded"}, status=403)
+    return None
+
+
+@sync_and_async_middleware
+def voice_upload_middleware(get_response):
+    """
+    Reject oversized voice uploads from the Content-Length header, and
+    uploads of users without quota. The checks run before any view
+    middleware, so before CsrfViewMiddleware reads ``request.POST`` and with
+    it the whole body. It must come after AuthenticationMiddleware.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if is_upload(request):
+                error = await sync_to_async(check_upload)(request)
+                if error is not None:
+                    return error
+            return await get_response(request)
+
+        markcoroutinefunction(middleware)
+    else:
+        def middleware(request):
+            return (is_upload(request) and check_upload(request)) or get_response(request)
+    return middleware
@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-18 20:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_user_and_report(apps, schema_editor):
+    Voice = apps.get_model("voice_process", "Voice")
+    for voice in Voice.objects.select_related("response").exclude(response=None).iterator():
+        voice.user_id = voice.response.user_id
+        voice.report_id = voice.response.report_id
+        voice.save(update_fields=["user", "report"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0002_question_text_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('voice_process', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voice',
+            name='created_time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='voice',
+            name='report',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='voice_report', to='report.report'),
+        ),
+        migrations.AddField(
+            model_name='voice',
+            name='transcript',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='voice',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='voice_user', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='voice',
+            name='response',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='voice_response', to='report.response'),
+        ),
+        migrations.RunPython(fill_user_and_report, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voice_process', '0002_voice_pipeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voice',
+            name='audio_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
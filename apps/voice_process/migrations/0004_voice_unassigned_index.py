@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voice_process', '0003_voice_audio_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voice',
+            index=models.Index(condition=models.Q(('response', None)), fields=['user', 'report'], name='voice_unassigned_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-18 20:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_quota(apps, schema_editor):
+    Voice = apps.get_model("voice_process", "Voice")
+    VoiceQuota = apps.get_model("voice_process", "VoiceQuota")
+    counts = Voice.objects.exclude(user=None).values("user_id").annotate(used=Count("id")).order_by()
+    VoiceQuota.objects.bulk_create(
+        [VoiceQuota(user_id=item["user_id"], used=item["used"]) for item in counts.iterator()], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('voice_process', '0004_voice_unassigned_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoiceQuota',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='voice_quota', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('used', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_quota, migrations.RunPython.noop),
+    ]
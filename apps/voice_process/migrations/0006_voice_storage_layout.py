@@ -0,0 +1,74 @@
+# Generated by Django 4.2 on 2026-10-18 20:22
+
+import apps.voice_process.models
+import apps.voice_process.storage
+import os
+import uuid
+
+from django.core.files.storage import default_storage, storages
+from django.db import migrations, models
+
+
+def move_voice(Voice, voice, source, target, name):
+    """
+    Copy one recording, point its row at the copy, then delete the
+    original. The migration is not atomic, so the row update is committed
+    before the original goes; an interrupted run leaves at most a stray
+    copy, never a row pointing at a deleted file.
+    """
+    old = voice.audio_file.name
+    if not source.exists(old):
+        return
+    with source.open(old, "rb") as file:
+        name = target.save(name, file)
+    Voice.objects.filter(pk=voice.pk).update(audio_file=name)
+    source.delete(old)
+
+
+def move_voices(apps, schema_editor):
+    """
+    Move the recordings from MEDIA_ROOT/<report name>/<username>/ to the
+    voice storage, under <sid>/<user id>/<yyyy>/<mm>/<uuid>.<ext>.
+    """
+    Voice = apps.get_model("voice_process", "Voice")
+    voice_storage = storages["voices"]
+    for voice in Voice.objects.exclude(audio_file="").iterator():
+        extension = os.path.splitext(voice.audio_file.name)[1].lower()
+        name = (
+            f"{voice.report_id or 'unassigned'}/{voice.user_id}/"
+            f"{voice.created_time:%Y/%m}/{uuid.uuid4().hex}{extension}"
+        )
+        move_voice(Voice, voice, default_storage, voice_storage, name)
+
+
+def restore_voices(apps, schema_editor):
+    """
+    Move the recordings back to MEDIA_ROOT/<report name>/<username>/.
+    """
+    Voice = apps.get_model("voice_process", "Voice")
+    voice_storage = storages["voices"]
+    voices = Voice.objects.exclude(audio_file="").select_related("report", "user")
+    for voice in voices.iterator():
+        report = voice.report.name if voice.report_id else "unassigned"
+        username = voice.user.username if voice.user_id else None
+        name = f"{report}/{username}/{os.path.basename(voice.audio_file.name)}"
+        move_voice(Voice, voice, voice_storage, default_storage, name)
+
+
+class Migration(migrations.Migration):
+
+    # Each moved voice is committed on its own, see move_voice.
+    atomic = False
+
+    dependencies = [
+        ('voice_process', '0005_voice_quota'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='voice',
+            name='audio_file',
+            field=models.FileField(storage=apps.voice_process.storage.get_voice_storage, upload_to=apps.voice_process.models.Voice.folder_picture_name),
+        ),
+        migrations.RunPython(move_voices, restore_voices),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voice_process', '0006_voice_storage_layout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheStat',
+            fields=[
+                ('kind', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('hit', models.PositiveBigIntegerField(default=0)),
+                ('miss', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,12 +1,64 @@
+import os
+import uuid
+
 from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
 
-from apps.report.models import Response
+from apps.report.models import Report, Response
+from apps.voice_process.storage import get_voice_storage
 
 
 class Voice(models.Model):
 
     def folder_picture_name(self, file):
-        return f"{self.response.report.name}/{self.response.user.username}/{file}"
-    
-    response = models.ForeignKey(Response, on_delete=models.CASCADE, related_name="voice_response")
-    audio_file = models.FileField(upload_to=folder_picture_name)
\ No newline at end of file
+        # <sid>/<user id>/<yyyy>/<mm>/<uuid>.<ext>, from ids only so saving a file needs no query.
+        report = self.report_id or "unassigned"
+        extension = os.path.splitext(file)[1].lower()
+        return f"{report}/{self.user_id}/{self.created_time:%Y/%m}/{uuid.uuid4().hex}{extension}"
+
+    response = models.ForeignKey(Response, on_delete=models.CASCADE, related_name="voice_response", null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="voice_user", null=True, blank=True)
+    report = models.ForeignKey(Report, on_delete=models.CASCADE, related_name="voice_report", null=True, blank=True)
+    audio_file = models.FileField(upload_to=folder_picture_name, storage=get_voice_storage)
+    audio_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    transcript = models.TextField(blank=True)
+    created_time = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Voices waiting to be linked to a response by RegisterAnswer.handler.
+            models.Index(
+                fields=["user", "report"], condition=models.Q(response=None), name="voice_unassigned_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - voice: {self.id}"
+
+
+class VoiceQuota(models.Model):
+    """
+    Number of stored voices per user, kept in step with ``Voice`` rows so
+    uploads don't have to count them.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="voice_quota")
+    used = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user} - {self.used}"
+
+
+class CacheStat(models.Model):
+    """
+    Hits and misses of the transcription and extraction caches, counted in
+    the database so that concurrent processes don't lose increments.
+    """
+
+    kind = models.CharField(max_length=32, primary_key=True)
+    hit = models.PositiveBigIntegerField(default=0)
+    miss = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.kind} - {self.hit}/{self.miss}"
@@ -0,0 +1,79 @@
+import functools
+import logging
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_TOKEN_BUDGET = settings.EXTRACTION_TOKEN_BUDGET
+
+# Part of the extraction cache key, bump it whenever the prompt changes.
+VERSION = 3
+
+SYSTEM_PROMPT = """
+شما یک دستیار مفید هستید که برای استخراج اطلاعات مرتبط با سلامت از گزارش‌های روزانه طراحی شده‌اید.
+یک فهرست شماره‌دار از سوالات و یک متن به شما داده می‌شود.
+پاسخ هر سوالی را که در متن آمده استخراج کنید و یک شیء JSON برگردانید که کلید آن شماره سوال و مقدار آن پاسخ است.
+سوالاتی که پاسخشان در متن نیست را در خروجی نیاورید و متن سوال را تکرار نکنید.
+لطفاً فقط JSON خالص برگردانید و از افزودن متن اضافی مثل ```json یا توضیحات خودداری کنید.
+سوالات:
+{questions}
+"""
+
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model_name):
+    import tiktoken
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # The BPE files are downloaded on first use, token counts are
+        # estimated when that is not possible.
+        logger.warning("tiktoken encoding for %s is not available", model_name, exc_info=True)
+        return None
+
+
+def count_tokens(text, model_name):
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return len(text) // 2 + 1
+    return len(encoding.encode(text))
+
+
+def question_lines(questions):
+    return [f"{question_id}. {' '.join(text.split())}" for question_id, text in questions]
+
+
+def build_messages(text, questions):
+    """
+    Build the extraction messages for ``[(question_id, question), ...]``.
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT.format(questions="\n".join(question_lines(questions)))},
+        {"role": "user", "content": text},
+    ]
+
+
+def split_questions(text, questions, model_name, budget=EXTRACTION_TOKEN_BUDGET):
+    """
+    Group the questions so that each extraction prompt, transcript included,
+    stays within ``budget`` tokens. A group always holds at least one question.
+    """
+    base = count_tokens(SYSTEM_PROMPT, model_name) + count_tokens(text, model_name)
+    groups, group, used = [], [], base
+    for question, line in zip(questions, question_lines(questions)):
+        tokens = count_tokens(line, model_name) + 1
+        if group and used + tokens > budget:
+            groups.append(group)
+            group, used = [], base
+        group.append(question)
+        used += tokens
+    if group:
+        groups.append(group)
+    return groups
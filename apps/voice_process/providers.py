@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from apps.voice_process import clients
+
+
+class AvalaiProvider:
+    """
+    Whisper transcription and chat completion through the AvalAI
+    OpenAI-compatible API, sharing the pooled clients of this process.
+    """
+
+    model_name = clients.CHAT_MODEL
+
+    def transcribe(self, file):
+        client = clients.get_openai_client()
+        with clients.provider_slot:
+            transcription = client.audio.transcriptions.create(
+                model="whisper-1",
+                file=file,
+                response_format="json",
+                language="fa"
+            )
+        return transcription.text
+
+    def complete(self, messages, json_mode=False):
+        llm = clients.get_chat_model()
+        if json_mode:
+            llm = llm.bind(response_format={"type": "json_object"})
+        with clients.provider_slot:
+            return llm.invoke(messages).model_dump()["content"]
+
+    def stream(self, messages, json_mode=False):
+        llm = clients.get_chat_model()
+        if json_mode:
+            llm = llm.bind(response_format={"type": "json_object"})
+        with clients.provider_slot:
+            for chunk in llm.stream(messages):
+                yield chunk.content
+
+    async def atranscribe(self, file):
+        client = clients.get_async_openai_client()
+        async with clients.get_async_provider_slot():
+            transcription = await client.audio.transcriptions.create(
+                model="whisper-1",
+                file=file,
+                response_format="json",
+                language="fa"
+            )
+        return transcription.text
+
+    async def acomplete(self, messages, json_mode=False):
+        llm = clients.get_async_chat_model()
+        if json_mode:
+            llm = llm.bind(response_format={"type": "json_object"})
+        async with clients.get_async_provider_slot():
+            return (await llm.ainvoke(messages)).model_dump()["content"]
+
+
+class FakeProvider:
+    """
+    Offline provider for development and tests: it returns a fixed
+    transcript and an empty extraction without any network call.
+    """
+
+    model_name = "fake"
+    transcript = "این یک متن آزمایشی است"
+
+    def transcribe(self, file):
+        return self.transcript
+
+    def complete(self, messages, json_mode=False):
+        return "{}"
+
+    def stream(self, messages, json_mode=False):
+        yield self.complete(messages, json_mode)
+
+    async def atranscribe(self, file):
+        return self.transcribe(file)
+
+    async def acomplete(self, messages, json_mode=False):
+        return self.complete(messages, json_mode)
+
+
+_provider = None
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        _provider = import_string(settings.VOICE_PROVIDER)()
+    return _provider
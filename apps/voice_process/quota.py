@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.db.models import F
+
+from apps.voice_process.models import Voice, VoiceQuota
+
+VOICE_QUOTA_LIMIT = settings.VOICE_QUOTA_LIMIT
+
+
+def get_quota(user_id):
+    quota, _ = VoiceQuota.objects.get_or_create(
+        user_id=user_id, defaults={"used": Voice.objects.filter(user_id=user_id).count()}
+    )
+    return quota
+
+
+def has_quota(user):
+    return get_quota(user.id).used < VOICE_QUOTA_LIMIT
+
+
+def reserve_quota(user):
+    """
+    Take one voice from the user's quota, return False when it is used up.
+    The check and the increment are one UPDATE, so concurrent uploads can't
+    both take the last one.
+    """
+    get_quota(user.id)
+    return bool(
+        VoiceQuota.objects.filter(user_id=user.id, used__lt=VOICE_QUOTA_LIMIT).update(used=F("used") + 1)
+    )
+
+
+def release_quota(user_id):
+    VoiceQuota.objects.filter(user_id=user_id, used__gt=0).update(used=F("used") - 1)
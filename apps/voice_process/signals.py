@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from apps.voice_process.models import Voice
+from apps.voice_process.quota import release_quota
+
+
+@receiver(post_delete, sender=Voice)
+def voice_deleted(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        release_quota(instance.user_id)
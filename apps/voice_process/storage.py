@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, storages
+from django.utils.encoding import filepath_to_uri
+
+
+class VoiceStorage(FileSystemStorage):
+    """
+    Voice recordings, kept outside MEDIA_ROOT so they have no public URL.
+    Downloads go through Django for the permission check and are handed to
+    nginx with ``X-Accel-Redirect`` (see :meth:`accel_path`).
+    """
+
+    def __init__(self, location=None, accel_prefix=None, **kwargs):
+        super().__init__(location=location or settings.VOICE_MEDIA_ROOT, **kwargs)
+        self.accel_prefix = accel_prefix or settings.VOICE_ACCEL_PREFIX
+
+    def accel_path(self, name):
+        return self.accel_prefix + filepath_to_uri(name)
+
+
+def get_voice_storage():
+    return storages["voices"]
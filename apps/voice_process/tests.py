@@ -1,3 +1,510 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import wave
+from unittest import mock
 
-# Create your tests here.
+import jdatetime
+from tenacity import wait_none
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.job.models import Job
+from apps.job.utils import claim_job
+from apps.report.models import Answer, Question, Report
+from apps.voice_process import audio, clients, extraction, middleware, prompt, providers, utils
+from apps.voice_process.models import CacheStat, Voice, VoiceQuota
+from apps.voice_process.storage import VoiceStorage
+from apps.voice_process.utils import RegisterAnswer
+from apps.voice_process.views import front
+
+
+# The file caches belong to the running site, tests use memory ones.
+TEST_CACHES = dict(
+    settings.CACHES,
+    voice={"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "voice"},
+    catalog={"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "catalog"},
+)
+
+
+def wav_bytes(seconds=1, rate=8000):
+    output = io.BytesIO()
+    with wave.open(output, "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(rate)
+        file.writeframes(b"\x00\x00" * int(seconds * rate))
+    return output.getvalue()
+
+
+class ScriptedProvider(providers.FakeProvider):
+    """
+    FakeProvider with a chosen extraction reply, recording its calls.
+    """
+
+    def __init__(self, reply="{}"):
+        self.reply = reply
+        self.transcribed = []
+        self.prompts = []
+
+    def transcribe(self, file):
+        self.transcribed.append(file)
+        return super().transcribe(file)
+
+    def complete(self, messages, json_mode=False):
+        self.prompts.append(messages)
+        return self.reply
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReportTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="participant")
+        cls.report = Report.objects.create(sid=10, name="daily", created_time=jdatetime.date.today())
+        cls.questions = [
+            Question.objects.create(report=cls.report, question=text) for text in ("خواب", "ورزش", "غذا")
+        ]
+
+    def setUp(self):
+        caches["catalog"].clear()
+        caches["voice"].clear()
+        # Offline, tiktoken can't download its encodings and the token
+        # counts are estimated.
+        self.enterContext(mock.patch.object(prompt.logger, "disabled", True))
+        self.provider = ScriptedProvider()
+        patcher = mock.patch.object(providers, "_provider", self.provider)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, True)
+        storage = mock.patch.object(Voice._meta.get_field("audio_file"), "storage", VoiceStorage(location=location))
+        storage.start()
+        self.addCleanup(storage.stop)
+
+
+class SaveAnswerTests(ReportTestCase):
+
+    def handle(self, answers):
+        with CaptureQueriesContext(connection) as context:
+            response = RegisterAnswer.handler({"report_sid": self.report.sid, "answers": answers}, self.user)
+        return response, len(context.captured_queries)
+
+    def test_handler_saves_answers_in_bulk(self):
+        self.handle([{"خواب": "کم"}])
+        _, one = self.handle([{"خواب": "کم"}])
+        answers = [{"خواب": "۸ ساعت"}, {"ورزش": "پیاده روی"}, {"unknown question": "ignored"}]
+        response, many = self.handle(answers)
+        # The number of queries doesn't grow with the number of answers.
+        self.assertEqual(one, many)
+        self.assertEqual(
+            dict(Answer.objects.filter(response=response).values_list("question__question", "answer")),
+            {"خواب": "۸ ساعت", "ورزش": "پیاده روی"},
+        )
+        response.refresh_from_db()
+        self.assertEqual(response.answer_count, 2)
+
+    def test_question_text_is_matched_normalized(self):
+        response = RegisterAnswer.handler(
+            {"report_sid": self.report.sid, "answers": [{" غذا ": "برنج"}]}, self.user
+        )
+        self.assertEqual(Answer.objects.get(response=response).question, self.questions[2])
+
+    def test_last_answer_to_a_question_wins(self):
+        response = RegisterAnswer.handler(
+            {"report_sid": self.report.sid, "answers": [{"خواب": "کم"}, {"خواب": "زیاد"}]}, self.user
+        )
+        self.assertEqual(list(Answer.objects.filter(response=response).values_list("answer", flat=True)), ["زیاد"])
+
+    def test_links_pending_voices(self):
+        voice = Voice.objects.create(user=self.user, report=self.report, audio_file="a.ogg")
+        response = RegisterAnswer.handler({"report_sid": self.report.sid, "answers": []}, self.user)
+        voice.refresh_from_db()
+        self.assertEqual(voice.response, response)
+
+
+class TranscribeJobTests(ReportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Without ffmpeg the voice is kept and sent as uploaded.
+        self.enterContext(mock.patch.object(audio.logger, "disabled", True))
+
+    def upload(self, content=None):
+        self.client.force_login(self.user)
+        audio_file = SimpleUploadedFile("voice.wav", content or wav_bytes(), content_type="audio/wav")
+        return self.client.post(reverse("speech-to-text"), {"audio_file": audio_file, "report_sid": self.report.sid})
+
+    def test_upload_is_transcribed_and_extracted_by_the_job(self):
+        sleep, food = self.questions[0], self.questions[2]
+        self.provider.reply = f'{{"{sleep.id}": "هشت ساعت", "{food.id}": "برنج"}}'
+        response = self.upload()
+        self.assertEqual(response.status_code, 202)
+        job = claim_job()
+        self.assertEqual(job.id, response.json()["job"])
+
+        result = utils.transcribe_job(job)
+        self.assertEqual(result, {
+            "text": providers.FakeProvider.transcript,
+            "answers": {str(sleep.id): "هشت ساعت", str(food.id): "برنج"},
+        })
+        self.assertEqual(Job.objects.get(pk=job.pk).result, result)
+        voice = Voice.objects.get(id=job.payload["voice"])
+        self.assertEqual(voice.transcript, providers.FakeProvider.transcript)
+        # The questions are sent as numbered lines, not their repr.
+        self.assertIn(f"{sleep.id}. خواب", self.provider.prompts[0][0]["content"])
+
+    def test_same_voice_is_answered_from_the_cache(self):
+        self.upload()
+        utils.transcribe_job(claim_job())
+        with mock.patch.object(utils, "compress_voice", wraps=utils.compress_voice) as compress_voice:
+            response = self.upload()
+            job = Job.objects.get(id=response.json()["job"])
+            # Finished at upload, without a second provider call.
+            self.assertEqual(job.status, Job.DONE)
+            self.assertEqual(len(self.provider.transcribed), 1)
+            self.assertEqual(len(self.provider.prompts), 1)
+            # Compressed by the worker, not in the request.
+            compress_voice.assert_not_called()
+            compress = claim_job()
+            self.assertEqual(compress.task, front.COMPRESS_TASK)
+            utils.compress_job(compress)
+        compress_voice.assert_called_once_with(Voice.objects.get(id=job.payload["voice"]))
+        self.assertEqual(
+            {stat.kind: (stat.hit, stat.miss) for stat in CacheStat.objects.all()},
+            {"transcript": (1, 1), "extraction": (1, 1)},
+        )
+
+
+    def test_compressed_voice_is_not_encoded_again(self):
+        voice = Voice.objects.create(user=self.user, report=self.report, audio_file=f"a.{audio.VOICE_AUDIO_FORMAT}")
+        with mock.patch.object(utils, "normalize_audio") as normalize_audio:
+            self.assertFalse(utils.compress_voice(voice))
+        normalize_audio.assert_not_called()
+
+
+class ChunkedTranscriptionTests(ReportTestCase):
+
+    def test_cut_points_fall_in_pauses(self):
+        recording = tone(5000) + silence(1000) + tone(5000) + silence(1000) + tone(5000)
+        points = audio.cut_points(recording, max_ms=6000, min_ms=1000)
+        self.assertEqual(len(points), 2)
+        self.assertAlmostEqual(points[0], 5500, delta=100)
+        self.assertAlmostEqual(points[1], 11500, delta=100)
+
+    def test_cut_without_pauses_at_the_limit(self):
+        self.assertEqual(audio.cut_points(tone(2500), max_ms=1000, min_ms=200), [1000, 2000])
+
+    def test_chunks_are_transcribed_in_order_and_retried(self):
+        voice = Voice.objects.create(
+            user=self.user, report=self.report, audio_file=SimpleUploadedFile("long.wav", wav_bytes())
+        )
+        chunks = [io.BytesIO(f"chunk {index}".encode()) for index in range(3)]
+        failed = []
+
+        def transcribe(file):
+            name, chunk = file
+            text = chunk.read().decode()
+            if name == "1.ogg" and not failed:
+                failed.append(name)
+                raise ConnectionError("reset")
+            return f" {text} "
+
+        self.provider.transcribe = transcribe
+        with mock.patch.object(utils, "split_audio", return_value=chunks), \
+                mock.patch.object(utils.transcribe_chunk.retry, "wait", wait_none()):
+            text = utils.transcribe_voice(voice)
+        self.assertEqual(text, "chunk 0 chunk 1 chunk 2")
+        self.assertEqual(failed, ["1.ogg"])
+        self.assertTrue(all(chunk.closed for chunk in chunks))
+
+
+class PromptTests(ReportTestCase):
+
+    def test_questions_are_numbered_lines(self):
+        system, user = prompt.build_messages("متن", [(7, "  خواب \n دیشب "), (9, "ورزش")])
+        self.assertIn("7. خواب دیشب\n9. ورزش", system["content"])
+        self.assertEqual(user, {"role": "user", "content": "متن"})
+
+    def test_split_questions_within_budget(self):
+        questions = [(index, f"سوال شماره {index} درباره وضعیت امروز") for index in range(40)]
+        base = prompt.count_tokens(prompt.SYSTEM_PROMPT, "fake") + prompt.count_tokens("متن", "fake")
+        groups = prompt.split_questions("متن", questions, "fake", budget=base + 60)
+        self.assertGreater(len(groups), 1)
+        self.assertEqual([question for group in groups for question in group], questions)
+        for group in groups:
+            used = sum(prompt.count_tokens(line, "fake") + 1 for line in prompt.question_lines(group))
+            self.assertLessEqual(used, 60)
+
+    def test_long_question_gets_its_own_group(self):
+        questions = [(1, "کوتاه"), (2, "بلند " * 200), (3, "کوتاه")]
+        budget = prompt.count_tokens(prompt.SYSTEM_PROMPT, "fake") + 50
+        groups = prompt.split_questions("متن", questions, "fake", budget=budget)
+        self.assertEqual(groups, [[questions[0]], [questions[1]], [questions[2]]])
+
+    def test_large_survey_is_extracted_in_parallel_calls(self):
+        self.provider.reply = json.dumps({str(question.id): question.question for question in self.questions})
+
+        def split_in_two(text, questions, model_name):
+            return [questions[:2], questions[2:]]
+
+        with mock.patch.object(prompt, "split_questions", split_in_two):
+            answers = RegisterAnswer.extract_answers("متن", self.report.sid)
+        self.assertEqual(answers, {question.id: question.question for question in self.questions})
+        self.assertEqual(len(self.provider.prompts), 2)
+
+
+class ExtractionTests(SimpleTestCase):
+
+    def parse(self, content, question_ids=(1, 2, 3)):
+        return extraction.parse_answers(content, list(question_ids))
+
+    def test_plain_reply(self):
+        self.assertEqual(self.parse('{"1": "هشت ساعت", "3": "برنج"}'), {1: "هشت ساعت", 3: "برنج"})
+
+    def test_code_fence_and_text_are_dropped(self):
+        self.assertEqual(self.parse('پاسخ:\n```json\n{"2": "پیاده روی"}\n```'), {2: "پیاده روی"})
+
+    def test_truncated_reply_keeps_complete_pairs(self):
+        self.assertEqual(self.parse('{"1": "کم", "2": "زیا'), {1: "کم"})
+
+    def test_values_are_validated(self):
+        reply = '{"1": 8, "2": ["a", "b"], "3": "", "9": "unknown"}'
+        # Numbers become text; lists, empty answers and unknown ids are dropped.
+        self.assertEqual(self.parse(reply), {1: "8"})
+
+    def test_reply_that_is_not_an_object(self):
+        with self.assertRaises(ValueError):
+            self.parse('["1", "2"]')
+        self.assertEqual(self.parse("no json at all"), {})
+
+    def test_completed_pairs_of_a_stream(self):
+        self.assertEqual(
+            list(extraction.completed_pairs('{"1": "کم", "2": "با \\"نقل\\"", "3": "نا')),
+            [(1, "کم"), (2, 'با "نقل"')],
+        )
+
+    def test_register_answer_returns_none_for_unusable_reply(self):
+        self.assertIsNone(RegisterAnswer.parse_answers("[]", [(1, "خواب")]))
+
+
+class VoiceEventsTests(ReportTestCase):
+
+    async def events(self, job):
+        return [event async for event in front.job_events(job.id)]
+
+    async def test_stream_ends_with_the_job(self):
+        job = await Job.objects.acreate(
+            task=front.TRANSCRIBE_TASK, status=Job.DONE, result={"text": "متن", "answers": {"1": "کم"}}
+        )
+        self.assertEqual(await self.events(job), [
+            front.server_event("transcript", {"text": "متن"}),
+            front.server_event("answer", {"question": "1", "answer": "کم"}),
+            front.server_event("done", {"error": False}),
+        ])
+
+    async def test_stream_of_a_stuck_job_times_out(self):
+        job = await Job.objects.acreate(task=front.TRANSCRIBE_TASK)
+        timing = {"EVENTS_POLL_INTERVAL": 0.01, "VOICE_EVENTS_TIMEOUT": 0.1, "VOICE_EVENTS_KEEPALIVE": 0.02}
+        with mock.patch.multiple(front, **timing):
+            events = await self.events(job)
+        self.assertIn(": keep-alive\n\n", events)
+        self.assertEqual(events[-1], front.server_event("timeout", {"job": job.id}))
+
+
+class VoiceStorageMigrationTests(ReportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.migration = importlib.import_module("apps.voice_process.migrations.0006_voice_storage_layout")
+        self.media = FileSystemStorage(location=tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.media.location, True)
+        self.voices = Voice._meta.get_field("audio_file").storage
+        self.enterContext(mock.patch.multiple(
+            self.migration, default_storage=self.media, storages={"voices": self.voices}
+        ))
+
+    def test_voices_are_moved_and_back(self):
+        self.media.save("daily/participant/voice.wav", io.BytesIO(b"audio"))
+        voice = Voice.objects.create(user=self.user, report=self.report, audio_file="daily/participant/voice.wav")
+
+        self.migration.move_voices(global_apps, None)
+        voice.refresh_from_db()
+        self.assertRegex(voice.audio_file.name, rf"^10/{self.user.id}/\d{{4}}/\d{{2}}/[0-9a-f]{{32}}\.wav$")
+        with self.voices.open(voice.audio_file.name) as file:
+            self.assertEqual(file.read(), b"audio")
+        self.assertFalse(self.media.exists("daily/participant/voice.wav"))
+
+        moved = voice.audio_file.name
+        self.migration.restore_voices(global_apps, None)
+        voice.refresh_from_db()
+        self.assertEqual(voice.audio_file.name, f"daily/participant/{os.path.basename(moved)}")
+        with self.media.open(voice.audio_file.name) as file:
+            self.assertEqual(file.read(), b"audio")
+        self.assertFalse(self.voices.exists(moved))
+
+    def test_migration_commits_each_voice(self):
+        self.assertFalse(self.migration.Migration.atomic)
+
+
+class VoiceAudioTests(ReportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.voice = Voice.objects.create(
+            user=self.user, report=self.report, audio_file=SimpleUploadedFile("voice.ogg", b"0123456789")
+        )
+        self.client.force_login(self.user)
+        self.enterContext(mock.patch.object(front, "VOICE_ACCEL_REDIRECT", False))
+
+    def get(self, range_header=None):
+        headers = {"HTTP_RANGE": range_header} if range_header else {}
+        return self.client.get(reverse("voice-audio", args=[self.voice.id]), **headers)
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+
+    def test_ranges(self):
+        for range_header, content_range, content in (
+            ("bytes=2-5", "bytes 2-5/10", b"2345"),
+            ("bytes=7-", "bytes 7-9/10", b"789"),
+            ("bytes=-3", "bytes 7-9/10", b"789"),
+            ("bytes=8-100", "bytes 8-9/10", b"89"),
+        ):
+            with self.subTest(range_header):
+                response = self.get(range_header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response["Content-Range"], content_range)
+                self.assertEqual(response["Content-Length"], str(len(content)))
+                self.assertEqual(b"".join(response.streaming_content), content)
+
+    def test_unsatisfiable_range(self):
+        response = self.get("bytes=20-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_other_users_get_404(self):
+        self.client.force_login(User.objects.create(username="other"))
+        self.assertEqual(self.get().status_code, 404)
+
+    def test_nginx_serves_the_file(self):
+        with mock.patch.object(front, "VOICE_ACCEL_REDIRECT", True):
+            response = self.get("bytes=2-5")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Accel-Redirect"], settings.VOICE_ACCEL_PREFIX + self.voice.audio_file.name)
+
+
+class UploadLimitTests(ReportTestCase):
+
+    def test_oversized_upload_is_rejected_before_the_body_is_read(self):
+        self.client.force_login(self.user)
+        with mock.patch("django.http.request.HttpRequest._load_post_and_files") as load:
+            response = self.client.post(
+                reverse("speech-to-text"), b"", content_type="multipart/form-data; boundary=x",
+                CONTENT_LENGTH=str(settings.VOICE_UPLOAD_MAX_SIZE + 1),
+            )
+        self.assertEqual(response.status_code, 413)
+        load.assert_not_called()
+        self.assertFalse(Voice.objects.exists())
+
+    def test_user_without_quota_is_rejected_before_the_body_is_read(self):
+        VoiceQuota.objects.create(user=self.user, used=settings.VOICE_QUOTA_LIMIT)
+        self.client.force_login(self.user)
+        with mock.patch("django.http.request.HttpRequest._load_post_and_files") as load:
+            response = self.client.post(reverse("speech-to-text"), {"audio_file": SimpleUploadedFile("a.wav", b"a")})
+        self.assertEqual(response.status_code, 403)
+        load.assert_not_called()
+
+    async def test_async_stack_is_checked_too(self):
+        with mock.patch.object(middleware, "VOICE_UPLOAD_MAX_SIZE", 10):
+            response = await self.async_client.post(
+                reverse("speech-to-text"), b"x" * 11, content_type="multipart/form-data; boundary=x"
+            )
+        self.assertEqual(response.status_code, 413)
+
+
+def tone(milliseconds):
+    from pydub.generators import Sine
+
+    return Sine(440).to_audio_segment(duration=milliseconds, volume=-10)
+
+
+def silence(milliseconds):
+    from pydub import AudioSegment
+
+    return AudioSegment.silent(duration=milliseconds)
+
+
+class AudioTests(SimpleTestCase):
+
+    def test_trim_silence(self):
+        trimmed = audio.trim_silence(silence(700) + tone(1000) + silence(900))
+        self.assertAlmostEqual(len(trimmed), 1000, delta=20)
+
+    def test_silent_audio_is_kept(self):
+        self.assertEqual(len(audio.trim_silence(silence(500))), 500)
+
+    def test_undecodable_file_is_not_normalized(self):
+        with mock.patch.object(audio.logger, "disabled", True):
+            self.assertIsNone(audio.normalize_audio(io.BytesIO(b"not audio")))
+
+    @unittest.skipUnless(shutil.which("ffmpeg"), "encoding needs ffmpeg")
+    def test_normalize_audio(self):
+        from pydub import AudioSegment
+
+        stereo = AudioSegment.from_mono_audiosegments(tone(2000), tone(2000)).set_frame_rate(44100)
+        source = io.BytesIO()
+        (silence(1000) + stereo).export(source, format="wav")
+        source.seek(0)
+        with audio.normalize_audio(source) as output:
+            self.assertLess(len(output.read()), len(source.getvalue()))
+            output.seek(0)
+            normalized = AudioSegment.from_file(output)
+        self.assertEqual(normalized.channels, 1)
+        self.assertEqual(normalized.frame_rate, audio.VOICE_SAMPLE_RATE)
+        self.assertAlmostEqual(len(normalized), 2000, delta=100)
+
+
+class ClientRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        clients.reset_clients()
+        self.addCleanup(clients.close_clients)
+
+    def test_clients_are_shared(self):
+        client = clients.get_openai_client()
+        self.assertIs(clients.get_openai_client(), client)
+        self.assertIs(client._client, clients.get_http_client())
+        self.assertIs(clients.get_chat_model(), clients.get_chat_model())
+
+    def test_sync_callers_open_no_async_pool(self):
+        clients.get_chat_model()
+        clients.get_openai_client()
+        self.assertNotIn("async_http", clients._clients)
+        self.assertIs(clients.get_async_chat_model().http_async_client, clients.get_async_http_client())
+
+    def test_pool_is_configured_from_settings(self):
+        pool = clients.get_http_client()._transport._pool
+        self.assertEqual(pool._max_connections, clients.AVALAI_MAX_CONNECTIONS)
+
+    def test_close_clients_closes_the_pool(self):
+        http_client = clients.get_http_client()
+        clients.close_clients()
+        self.assertTrue(http_client.is_closed)
+        self.assertIsNot(clients.get_http_client(), http_client)
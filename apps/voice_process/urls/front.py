@@ -1,7 +1,16 @@
+from django.conf import settings
 from django.urls import path
-from apps.voice_process.views.front import transfer_voice_to_text
+from apps.voice_process.views.front import (
+    atransfer_voice_to_text, transfer_voice_to_text, voice_audio, voice_events
+)
 
 
 urlpatterns = [
-    path("speech-to-text/", transfer_voice_to_text, name="speech-to-text")
+    path(
+        "speech-to-text/",
+        atransfer_voice_to_text if settings.ASYNC_VIEWS else transfer_voice_to_text,
+        name="speech-to-text",
+    ),
+    path("jobs/<int:id>/events/", voice_events, name="voice-events"),
+    path("<int:id>/audio/", voice_audio, name="voice-audio"),
 ]
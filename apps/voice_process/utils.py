@@ -1,59 +1,149 @@
-from io import BytesIO
-import json
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import jdatetime
-from langchain_openai import ChatOpenAI
-from openai import OpenAI
+from asgiref.sync import sync_to_async
+from tenacity import retry, stop_after_attempt, wait_exponential
 
-from apps.report.models import Answer, Question, Report, Response
+from apps.report.models import Answer, Question, Response
+from apps.report.stats import record_response
+from apps.report.utils import find_question, get_question_map
+from apps.voice_process import cache as voice_cache, prompt
+from apps.voice_process.audio import VOICE_AUDIO_FORMAT, normalize_audio, split_audio
 from apps.voice_process.models import Voice
+from apps.voice_process.providers import get_provider
+from apps.voice_process.quota import release_quota, reserve_quota
 
 from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
 
 
+VOICE_CHUNK_WORKERS = settings.VOICE_CHUNK_WORKERS
+VOICE_CHUNK_RETRIES = settings.VOICE_CHUNK_RETRIES
 
-AVALAI_BASE_URL = settings.AVALAI_BASE_URL
-AVALAI_API_KEY = settings.AVALAI_API_KEY
 
 class RegisterAnswer:
 
     @staticmethod
     def chat_completions_api(text, questions):
-        messages = [
-            {"role": "system", "content": f"""
-            شما یک دستیار مفید هستید که برای استخراج اطلاعات مرتبط با سلامت از گزارش‌های روزانه طراحی شده‌اید.
-            اطلاعات را در قالب JSON با کلیدهای زیر برگردانید:
-            من به شما یک دیکشنری از سوالات میدم که کلیدشون بدون پاسخ هست
-            یک متن هم بهت میدم هر کدوم پاسخ این سوالات بود استخراج کن و با بدون پاسخ جایگزین کن
-             هر کدوم هم نبود تغییرش نده
-            لیست سوالات = {questions}
-            توی پاسخ از /n استفاده نکن و یکاری کن وقتی من content رو گرفتم تبدیلش کنم به دیکشنری
-            لطفاً فقط JSON خالص برگردانید و از افزودن متن اضافی مثل ```json یا توضیحات خودداری کنید.
-        """},
-            {"role": "user", "content": text},
-        ]
-        model_name = "gpt-4o-mini"
-        llm = ChatOpenAI(
-            model=model_name, base_url=AVALAI_BASE_URL, api_key=AVALAI_API_KEY
-        )
-        return llm.invoke(messages).model_dump()["content"]
+        return get_provider().complete(prompt.build_messages(text, questions), json_mode=True)
+
+    @staticmethod
+    def parse_answers(content, questions):
+        # pydantic is only needed once there is a reply to validate.
+        from apps.voice_process import extraction
+
+        try:
+            return extraction.parse_answers(content, [question_id for question_id, _ in questions])
+        except ValueError:
+            return None
+
+    @classmethod
+    def extraction_key(cls, text, report):
+        questions = list(Question.objects.filter(report_id=report).order_by("id").values_list("id", "question"))
+        model_name = f"{get_provider().model_name}:{prompt.VERSION}"
+        return questions, voice_cache.extraction_key(text, questions, model_name)
+
+    @classmethod
+    def request_answers(cls, text, questions, on_answer=None):
+        if on_answer is None:
+            return cls.parse_answers(cls.chat_completions_api(text, questions), questions)
+        from apps.voice_process import extraction
+
+        content, sent = "", set()
+        question_ids = {question_id for question_id, _ in questions}
+        for chunk in get_provider().stream(prompt.build_messages(text, questions), json_mode=True):
+            content += chunk
+            for question_id, answer in extraction.completed_pairs(content):
+                if answer and question_id in question_ids and question_id not in sent:
+                    sent.add(question_id)
+                    on_answer(question_id, answer)
+        return cls.parse_answers(content, questions)
+
+    @classmethod
+    def extract_answers(cls, text, report, on_answer=None):
+        """
+        Return ``{question_id: answer}`` for the questions of ``report``
+        answered in ``text``. ``on_answer(question_id, answer)`` is called
+        as soon as each answer arrives from the streamed reply.
+        """
+        questions, key = cls.extraction_key(text, report)
+        answers = voice_cache.get_extraction(key)
+        if answers is not None:
+            if on_answer is not None:
+                for question_id, answer in answers.items():
+                    on_answer(question_id, answer)
+            return answers
+        groups = prompt.split_questions(text, questions, get_provider().model_name)
+        if len(groups) == 1:
+            results = [cls.request_answers(text, groups[0], on_answer)]
+        else:
+            def request(group):
+                try:
+                    return cls.request_answers(text, group, on_answer)
+                finally:
+                    connection.close()
+
+            with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+                results = list(executor.map(request, groups))
+        answers = {}
+        for result in results:
+            answers.update(result or {})
+        if results and None not in results:
+            voice_cache.set_extraction(key, answers)
+        return answers
+
+    @classmethod
+    async def aextract_answers(cls, text, report):
+        questions, key = await sync_to_async(cls.extraction_key)(text, report)
+        answers = await sync_to_async(voice_cache.get_extraction)(key)
+        if answers is not None:
+            return answers
+        groups = prompt.split_questions(text, questions, get_provider().model_name)
+        results = await asyncio.gather(*(
+            cls.arequest_answers(text, group) for group in groups
+        ))
+        answers = {}
+        for result in results:
+            answers.update(result or {})
+        if results and None not in results:
+            await sync_to_async(voice_cache.set_extraction)(key, answers)
+        return answers
+
+    @classmethod
+    async def arequest_answers(cls, text, questions):
+        content = await get_provider().acomplete(prompt.build_messages(text, questions), json_mode=True)
+        return cls.parse_answers(content, questions)
 
-    
     @classmethod
     def save_answer(cls, response, answers):
+        questions = get_question_map(response.report_id)
+        # One answer per question, the last one wins.
+        found = {}
         for i in answers:
             for que, ans in i.items():
-                question_instance = Question.objects.filter(question=que).last()
-                answers = Answer.objects.create(
-                    response=response, question=question_instance, answer=ans, created_time=jdatetime.date.today()
-                )
+                question_id = find_question(questions, que)
+                if question_id is not None:
+                    found[question_id] = ans
+        instances = [
+            Answer(response=response, question_id=question_id, answer=ans) for question_id, ans in found.items()
+        ]
+        Answer.objects.bulk_create(instances)
+        response.answer_count = len(instances)
+        response.summary = Response.summarize(instance.answer for instance in instances)
+        response.save(update_fields=["answer_count", "summary"])
+        record_response(response, list(found))
         return True
             
     @classmethod
     def create_response(cls, report, user):
         time = jdatetime.date.today()
         instance = Response.objects.create(
-            report=Report.objects.get(sid=report), user=user, created_time=time 
+            report_id=report, user=user, created_time=time
         )
         return instance
 
@@ -61,46 +151,154 @@ class RegisterAnswer:
     def handler(cls, data, user):
         report = data["report_sid"]
         answers = data["answers"]
-        response = cls.create_response(report, user)
-
-        save_answer = cls.save_answer(response, answers)
+        with transaction.atomic():
+            response = cls.create_response(report, user)
+            save_answer = cls.save_answer(response, answers)
+            Voice.objects.filter(user=user, report_id=report, response=None).update(response=response)
         if save_answer:
             return response
         else:
             return None
 
 
-def save_voice(user, response, voice):
-    counts = Voice.objects.filter(response__user=user).count()
+def save_voice(user, voice, report=None):
+    if not reserve_quota(user):
+        return None
     try:
-        if counts < 20:
-            instance = Voice.objects.create(
-                response=response, audio_file=voice
-            )
-            return instance
-    except:
+        return Voice.objects.create(
+            user=user, report_id=report, audio_file=voice, audio_hash=voice_cache.file_digest(voice)
+        )
+    except Exception:
+        release_quota(user.id)
+        raise
+
+
+def voice_process_api(voice):
+    return get_provider().transcribe(voice)
+
+
+def compress_voice(voice):
+    name = voice.audio_file.name
+    if Path(name).suffix == f".{VOICE_AUDIO_FORMAT}":
+        # Compressed already, by an earlier job or on the client.
+        return False
+    with voice.audio_file.open("rb") as file:
+        compressed = normalize_audio(file)
+    if compressed is None:
         return False
-    
+    with compressed:
+        voice.audio_file.save(f"{Path(name).stem}.{VOICE_AUDIO_FORMAT}", File(compressed), save=False)
+    voice.save(update_fields=["audio_file"])
+    voice.audio_file.storage.delete(name)
+    return True
 
-class StreamingFile(BytesIO):
-    def __init__(self, file):
-        super().__init__(file.read())
-        self.name = file.name
 
+@retry(stop=stop_after_attempt(VOICE_CHUNK_RETRIES), wait=wait_exponential(multiplier=1, max=10), reraise=True)
+def transcribe_chunk(name, chunk):
+    chunk.seek(0)
+    return voice_process_api((name, chunk))
 
-def voice_process_api(voice):
-    client = OpenAI(
-        base_url=AVALAI_BASE_URL,
-        api_key=AVALAI_API_KEY
-    )
+
+def transcribe_voice(voice):
+    with voice.audio_file.open("rb") as file:
+        chunks = split_audio(file)
+        if chunks is None:
+            # Hand the provider the stored file itself, it is streamed from disk.
+            file.seek(0)
+            return voice_process_api((os.path.basename(file.name), file.file))
     try:
-        transcription = client.audio.transcriptions.create(
-            model="whisper-1", 
-            file=voice, 
-            response_format="text",
-            language="fa"
-        )
-    except Exception as e:
-        raise e
-    return json.loads(transcription)
-    
\ No newline at end of file
+        names = [f"{index}.{VOICE_AUDIO_FORMAT}" for index in range(len(chunks))]
+        with ThreadPoolExecutor(max_workers=VOICE_CHUNK_WORKERS) as executor:
+            texts = executor.map(transcribe_chunk, names, chunks)
+            return " ".join(text.strip() for text in texts)
+    finally:
+        for chunk in chunks:
+            chunk.close()
+
+
+async def atranscribe_voice(voice):
+    provider = get_provider()
+    with voice.audio_file.open("rb") as file:
+        chunks = await sync_to_async(split_audio)(file)
+        if chunks is None:
+            file.seek(0)
+            return await provider.atranscribe((os.path.basename(file.name), file.file))
+    try:
+        texts = await asyncio.gather(*(
+            provider.atranscribe((f"{index}.{VOICE_AUDIO_FORMAT}", chunk))
+            for index, chunk in enumerate(chunks)
+        ))
+        return " ".join(text.strip() for text in texts)
+    finally:
+        for chunk in chunks:
+            chunk.close()
+
+
+async def aprocess_voice(voice):
+    """
+    Transcribe and extract a voice inside the event loop, for the async
+    upload view when VOICE_INLINE is enabled.
+    """
+    await sync_to_async(compress_voice)(voice)
+    text = await sync_to_async(voice_cache.get_transcript)(voice.audio_hash)
+    if text is None:
+        text = await atranscribe_voice(voice)
+        await sync_to_async(voice_cache.set_transcript)(voice.audio_hash, text)
+    voice.transcript = text
+    await voice.asave(update_fields=["transcript"])
+    answers = {}
+    if voice.report_id is not None:
+        answers = await RegisterAnswer.aextract_answers(text, voice.report_id)
+    return {"text": text, "answers": {str(question_id): answer for question_id, answer in answers.items()}}
+
+
+def cached_result(voice):
+    """
+    Return the job result of a voice whose transcript and extraction are
+    both cached already, without any provider call. Misses are left to the
+    job, and so is compressing the voice (see compress_job).
+    """
+    text = voice_cache.get_transcript(voice.audio_hash, count_miss=False)
+    if text is None:
+        return None
+    answers = {}
+    if voice.report_id is not None:
+        _, key = RegisterAnswer.extraction_key(text, voice.report_id)
+        answers = voice_cache.get_extraction(key, count_miss=False)
+        if answers is None:
+            return None
+    voice.transcript = text
+    voice.save(update_fields=["transcript"])
+    return {"text": text, "answers": answers}
+
+
+def compress_job(job):
+    return compress_voice(Voice.objects.get(id=job.payload["voice"]))
+
+
+def transcribe_job(job):
+    voice = Voice.objects.get(id=job.payload["voice"])
+    job.set_progress(0, 2)
+    compress_voice(voice)
+    text = voice_cache.get_transcript(voice.audio_hash)
+    if text is None:
+        text = transcribe_voice(voice)
+        voice_cache.set_transcript(voice.audio_hash, text)
+    voice.transcript = text
+    voice.save(update_fields=["transcript"])
+    result = {"text": text, "answers": {}}
+    job.publish(result)
+    job.set_progress(1)
+
+    if voice.report_id is not None:
+        lock = threading.Lock()
+
+        def on_answer(question_id, answer):
+            with lock:
+                result["answers"][str(question_id)] = answer
+                job.publish(result)
+
+        answers = RegisterAnswer.extract_answers(text, voice.report_id, on_answer)
+        result["answers"] = {str(question_id): answer for question_id, answer in answers.items()}
+    job.set_progress(2)
+    return result
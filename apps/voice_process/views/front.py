@@ -1,17 +1,217 @@
+import asyncio
+import json
+import mimetypes
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
-from django.http import JsonResponse
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+)
+from django.urls import reverse
 
+from apps.account.decorators import aget_user, async_login_required
+from apps.job.models import Job
+from apps.job.utils import complete, enqueue
 from apps.voice_process import utils
+from apps.voice_process.models import Voice
+
+
+VOICE_UPLOAD_MAX_SIZE = settings.VOICE_UPLOAD_MAX_SIZE
+TRANSCRIBE_TASK = "apps.voice_process.utils.transcribe_job"
+COMPRESS_TASK = "apps.voice_process.utils.compress_job"
+VOICE_INLINE = settings.VOICE_INLINE
+EVENTS_POLL_INTERVAL = 0.5
+VOICE_EVENTS_TIMEOUT = settings.VOICE_EVENTS_TIMEOUT
+VOICE_EVENTS_KEEPALIVE = settings.VOICE_EVENTS_KEEPALIVE
+VOICE_ACCEL_REDIRECT = settings.VOICE_ACCEL_REDIRECT
+RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def read_upload(request):
+    """
+    Return ``(audio_file, error_response)`` for a voice upload request.
+    """
+    # The Content-Length is checked by voice_upload_middleware, before
+    # CsrfViewMiddleware parses the body; this checks the file itself.
+    audio_file = request.FILES.get("audio_file")
+    if not audio_file:
+        return None, JsonResponse({"error": "error"}, status=400)
+    if audio_file.size > VOICE_UPLOAD_MAX_SIZE:
+        return None, JsonResponse({"error": "file too large"}, status=413)
+    return audio_file, None
+
+
+def job_response(job):
+    return JsonResponse({
+        "job": job.id,
+        "status_url": reverse("job-status", args=[job.id]),
+        "events_url": reverse("voice-events", args=[job.id]),
+    }, status=202)
+
+
+def quota_exceeded():
+    return JsonResponse({"error": "voice quota exceeded"}, status=403)
 
 
 @require_POST
+@login_required
 def transfer_voice_to_text(request):
-    audio_file = request.FILES["audio_file"]
-    if audio_file:
-        in_memory_file = utils.StreamingFile(audio_file)
-        response = utils.voice_process_api(voice=in_memory_file)
-        if response is None:
-            return JsonResponse({"error": "error"})
-        else:
-            save_voice = utils.save_voice(user=request.user, voice=audio_file, response=response)
-            return JsonResponse({"success": response["text"]})  
+    # The quota was checked by voice_upload_middleware before the body was
+    # read; save_voice reserves it atomically.
+    audio_file, error = read_upload(request)
+    if error is not None:
+        return error
+    report = request.POST.get("report_sid") or None
+    voice = utils.save_voice(user=request.user, voice=audio_file, report=report)
+    if not voice:
+        return quota_exceeded()
+    payload = {"voice": voice.id}
+    result = utils.cached_result(voice)
+    if result is not None:
+        job = complete(TRANSCRIBE_TASK, result, payload, user=request.user)
+        # Encoding is too slow for the request, the worker compresses it.
+        enqueue(COMPRESS_TASK, payload, user=request.user)
+    else:
+        job = enqueue(TRANSCRIBE_TASK, payload, user=request.user)
+    return job_response(job)
+
+
+@async_login_required
+async def atransfer_voice_to_text(request):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    # Parsing the multipart body reads and writes files, off the event loop.
+    audio_file, error = await sync_to_async(read_upload)(request)
+    if error is not None:
+        return error
+    report = request.POST.get("report_sid") or None
+    voice = await sync_to_async(utils.save_voice)(user=request.user, voice=audio_file, report=report)
+    if not voice:
+        return quota_exceeded()
+    payload = {"voice": voice.id}
+    result = await sync_to_async(utils.cached_result)(voice)
+    if result is not None:
+        # Encoding is too slow for the request, the worker compresses it.
+        await sync_to_async(enqueue)(COMPRESS_TASK, payload, user=request.user)
+    elif VOICE_INLINE:
+        result = await utils.aprocess_voice(voice)
+    if result is not None:
+        job = await sync_to_async(complete)(TRANSCRIBE_TASK, result, payload, user=request.user)
+    else:
+        job = await sync_to_async(enqueue)(TRANSCRIBE_TASK, payload, user=request.user)
+    return job_response(job)
+
+
+def server_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def job_events(id):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + VOICE_EVENTS_TIMEOUT
+    keepalive = loop.time() + VOICE_EVENTS_KEEPALIVE
+    sent_text, sent_answers = False, set()
+    while True:
+        job = await Job.objects.aget(id=id)
+        result = job.result or {}
+        if not sent_text and "text" in result:
+            sent_text = True
+            yield server_event("transcript", {"text": result["text"]})
+        for question_id, answer in result.get("answers", {}).items():
+            if question_id not in sent_answers:
+                sent_answers.add(question_id)
+                yield server_event("answer", {"question": question_id, "answer": answer})
+        if job.is_finished:
+            yield server_event(job.status, {"error": bool(job.error)})
+            return
+        now = loop.time()
+        if now >= deadline:
+            # The client can fall back to polling the job status.
+            yield server_event("timeout", {"job": id})
+            return
+        if now >= keepalive:
+            # A comment line, keeps proxies from closing an idle stream.
+            yield ": keep-alive\n\n"
+            keepalive = now + VOICE_EVENTS_KEEPALIVE
+        await asyncio.sleep(EVENTS_POLL_INTERVAL)
+
+
+async def voice_events(request, id):
+    """
+    Server-sent events for a transcription job: the transcript once it is
+    ready, then every extracted answer as the worker receives it. The
+    stream ends with the job status, or with ``timeout`` after
+    VOICE_EVENTS_TIMEOUT seconds.
+    """
+    user = await aget_user(request)
+    if user is None:
+        raise Http404
+    if not await Job.objects.filter(id=id, user=user, task=TRANSCRIBE_TASK).aexists():
+        raise Http404
+    response = StreamingHttpResponse(job_events(id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def file_range(file, start, length, block_size=64 * 1024):
+    with file:
+        file.seek(start)
+        while length > 0:
+            data = file.read(min(block_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def range_response(request, file, content_type):
+    """
+    Serve ``file`` with single ``Range`` request support, for development
+    setups without nginx.
+    """
+    size = file.size
+    match = RANGE.match(request.headers.get("Range", ""))
+    if not match or match.groups() == ("", ""):
+        response = FileResponse(file.open("rb"), content_type=content_type)
+        response["Accept-Ranges"] = "bytes"
+        return response
+    start, end = match.groups()
+    if start:
+        start, end = int(start), min(int(end or size - 1), size - 1)
+    else:
+        start, end = max(size - int(end), 0), size - 1
+    if start > end:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    response = StreamingHttpResponse(
+        file_range(file.open("rb"), start, end - start + 1), status=206, content_type=content_type
+    )
+    response["Content-Length"] = str(end - start + 1)
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+@login_required
+def voice_audio(request, id):
+    try:
+        voice = Voice.objects.only("user_id", "audio_file").get(id=id)
+    except Voice.DoesNotExist:
+        raise Http404
+    if voice.user_id != request.user.id and not request.user.is_staff:
+        raise Http404
+    if not voice.audio_file:
+        raise Http404
+    content_type = mimetypes.guess_type(voice.audio_file.name)[0] or "application/octet-stream"
+    if not VOICE_ACCEL_REDIRECT:
+        return range_response(request, voice.audio_file, content_type)
+    # nginx serves the file (and any Range) from its internal location.
+    response = HttpResponse(content_type=content_type)
+    response["X-Accel-Redirect"] = voice.audio_file.storage.accel_path(voice.audio_file.name)
+    response["Cache-Control"] = "private, max-age=3600"
+    return response
@@ -36,6 +36,7 @@ INSTALLED_APPS = [
     "apps.main",
     "apps.report",
     "apps.voice_process",
+    "apps.job",
 
     # other apps
     "rest_framework"
@@ -47,6 +48,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.voice_process.middleware.voice_upload_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,6 +73,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# Serve the I/O bound views as async views, for the ASGI (uvicorn) deployment.
+ASYNC_VIEWS = (os.environ.get("ASYNC_VIEWS") or "1") == "1"
+
 
 # Local settings import fron local_settings.py
 DATABASES = LOCAL_DATABASES
@@ -122,6 +127,78 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Voice recordings are private: stored outside MEDIA_ROOT and served by
+# nginx from an internal location after the download view checks access.
+VOICE_MEDIA_ROOT = os.environ.get("VOICE_MEDIA_ROOT") or os.path.join(BASE_DIR, "voices")
+VOICE_ACCEL_PREFIX = "/protected/voices/"
+# Without nginx (development) the download view streams the file itself.
+VOICE_ACCEL_REDIRECT = (os.environ.get("VOICE_ACCEL_REDIRECT") or ("0" if DEBUG else "1")) == "1"
+
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    "voices": {"BACKEND": "apps.voice_process.storage.VoiceStorage"},
+}
+
+# Uploads above this size are spooled to a temporary file, voices are then
+# moved into VOICE_MEDIA_ROOT instead of being copied.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+# Checked from Content-Length by apps.voice_process.middleware, nginx has its
+# own limit in nginx/snippets/voice_upload.conf
+VOICE_UPLOAD_MAX_SIZE = int(os.environ.get("VOICE_UPLOAD_MAX_SIZE") or 25 * 1024 * 1024)
+# Voices a user can store
+VOICE_QUOTA_LIMIT = int(os.environ.get("VOICE_QUOTA_LIMIT") or 20)
+
+# Voices are stored and transcribed as mono 16 kHz Opus (needs ffmpeg)
+VOICE_AUDIO_FORMAT = "ogg"
+VOICE_AUDIO_CODEC = "libopus"
+VOICE_AUDIO_BITRATE = "24k"
+VOICE_SAMPLE_RATE = 16000
+# dBFS below which leading and trailing audio is trimmed
+VOICE_SILENCE_THRESHOLD = -45
+
+# Longer recordings are split on pauses and transcribed in parallel
+VOICE_CHUNK_SECONDS = 120
+VOICE_CHUNK_MIN_SECONDS = 30
+VOICE_CHUNK_WORKERS = 4
+VOICE_CHUNK_RETRIES = 3
+
+
+# Transcriptions and extractions are cached by content hash in "voice"
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "voice": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache", "voice"),
+        "TIMEOUT": int(os.environ.get("VOICE_CACHE_TTL") or 60 * 60 * 24 * 7),
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+    # Report catalog and question maps (apps.report.catalog). On disk by
+    # default, shared by the processes of one host; set CATALOG_CACHE_URL
+    # (redis://...) to share it between hosts. Entries of old catalog
+    # versions expire after TIMEOUT, only the version key is kept forever.
+    "catalog": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["CATALOG_CACHE_URL"],
+        "TIMEOUT": 60 * 60 * 24,
+    } if os.environ.get("CATALOG_CACHE_URL") else {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache", "catalog"),
+        "TIMEOUT": 60 * 60 * 24,
+        # One entry per report and version plus the question maps; culling
+        # picks files at random and may drop the version key, which only
+        # invalidates the catalog once more.
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+# Identifies the deployed code in the ETag of the catalog pages, e.g. the
+# git commit; a digest of the templates when empty
+BUILD_ID = os.environ.get("BUILD_ID") or ""
+# Seconds a process keeps using the catalog version it read last
+CATALOG_LOCAL_TTL = int(os.environ.get("CATALOG_LOCAL_TTL") or 5)
+
 LOGIN_URL = 'login'
 
 
@@ -135,3 +212,67 @@ LOGIN_REDIRECT_URL = 'index'
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 30  
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 
+
+# LimeSurvey sync
+LIMESURVEY_SYNC_WORKERS = int(os.environ.get("LIMESURVEY_SYNC_WORKERS") or 8)
+LIMESURVEY_SYNC_INTERVAL = int(os.environ.get("LIMESURVEY_SYNC_INTERVAL") or 0)
+# (connect, read) timeouts in seconds
+LIMESURVEY_TIMEOUT = (5, 60)
+LIMESURVEY_RETRIES = 4
+LIMESURVEY_SESSION_TTL = 60 * 60
+# JSON-RPC batch requests, only if the LimeSurvey server accepts them
+LIMESURVEY_BATCHING = (os.environ.get("LIMESURVEY_BATCHING") or "0") == "1"
+LIMESURVEY_BATCH_SIZE = 20
+LIMESURVEY_ASYNC = (os.environ.get("LIMESURVEY_ASYNC") or "1") == "1"
+# Responses imported from LimeSurvey (apps.report.utils.import_job)
+LIMESURVEY_IMPORT_INTERVAL = int(os.environ.get("LIMESURVEY_IMPORT_INTERVAL") or 0)
+LIMESURVEY_IMPORT_BATCH_SIZE = 500
+# Responses still in progress this many seconds after they were first seen
+# are taken as abandoned and no longer checked
+LIMESURVEY_PENDING_MAX_AGE = int(os.environ.get("LIMESURVEY_PENDING_MAX_AGE") or 7 * 24 * 60 * 60)
+
+# Cached {text_hash: question_id} map per report and catalog version
+QUESTION_MAP_TIMEOUT = 60 * 60 * 24
+
+# Responses per chunk of a report export
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE") or 2000)
+
+# Responses per page on "my reports"
+MY_REPORTS_PAGE_SIZE = int(os.environ.get("MY_REPORTS_PAGE_SIZE") or 20)
+
+
+# Background jobs (python manage.py run_jobs)
+# A running job is requeued when its heartbeat is older than JOB_STALE_AFTER
+JOB_HEARTBEAT_INTERVAL = 30
+JOB_STALE_AFTER = 5 * 60
+# A stale job that was already claimed this many times is marked failed
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS") or 3)
+
+# task -> interval in seconds, 0 disables the periodic run
+JOB_SCHEDULE = {
+    "apps.report.utils.sync_job": LIMESURVEY_SYNC_INTERVAL,
+    "apps.report.utils.import_job": LIMESURVEY_IMPORT_INTERVAL,
+    "apps.report.stats.rollup_job": int(os.environ.get("STATS_ROLLUP_INTERVAL") or 60 * 60),
+}
+
+
+# AvalAI (OpenAI compatible) provider clients
+AVALAI_HTTP2 = True
+AVALAI_TIMEOUT = float(os.environ.get("AVALAI_TIMEOUT") or 120)
+AVALAI_CONNECT_TIMEOUT = 10
+AVALAI_MAX_CONNECTIONS = 20
+AVALAI_MAX_RETRIES = 2
+AVALAI_MAX_CONCURRENCY = int(os.environ.get("AVALAI_MAX_CONCURRENCY") or 8)
+
+# Prompt tokens per extraction call, larger surveys are split across calls
+EXTRACTION_TOKEN_BUDGET = 6000
+
+# Seconds a voice events stream stays open, and between keep-alive comments
+VOICE_EVENTS_TIMEOUT = int(os.environ.get("VOICE_EVENTS_TIMEOUT") or 5 * 60)
+VOICE_EVENTS_KEEPALIVE = 15
+
+# Transcribe in the async upload view instead of the job worker
+VOICE_INLINE = (os.environ.get("VOICE_INLINE") or "0") == "1"
+
+# apps.voice_process.providers.FakeProvider answers locally without network calls
+VOICE_PROVIDER = os.environ.get("VOICE_PROVIDER") or "apps.voice_process.providers.AvalaiProvider"
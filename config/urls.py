@@ -18,25 +18,23 @@ from django.contrib import admin
 from django.urls import include, path, reverse_lazy
 from django.views.generic.base import RedirectView
 
-from django.conf.urls.static import static
-
-from config import settings
-
 handler404 = 'apps.main.views.admin.custom_page_not_found'
 handler500 = 'apps.main.views.admin.custom_page_server_error'
 
 admin_urls = [
     path('modeladmin/', admin.site.urls),
-    path("paneladmin/", include("apps.main.urls.admin"))
+    path("paneladmin/", include("apps.main.urls.admin")),
+    path("paneladmin/reports/", include("apps.report.urls.admin")),
 ]
 
 front_urls = [
     path("account/", include("apps.account.urls.front")),
     path("reports/", include("apps.report.urls.front")),
     path("voice/", include("apps.voice_process.urls.front")),
+    path("jobs/", include("apps.job.urls.front")),
     path("", include("apps.main.urls.front")),
 ]
 
 urlpatterns = [
     
-] + admin_urls + front_urls + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+] + admin_urls + front_urls
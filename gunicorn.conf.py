@@ -0,0 +1,8 @@
+def post_fork(server, worker):
+    from apps.voice_process.clients import reset_clients
+    reset_clients()
+
+
+def worker_exit(server, worker):
+    from apps.voice_process.clients import close_clients
+    close_clients()